@@ -3,9 +3,18 @@ import re
 import streamlit as st
 import configparser
 import src.local_llm as local_llm
-from src.utils import convert_mp4_to_mp3, download_audio, summarize_openai_text, transcribe, \
-    trim_video, video_info, parse_time_to_hhmmss, parse_time_to_seconds
+from src.utils import audio_stream_url, compact_audio_name, download_audio, transcribe_stream, video_info, \
+    parse_time_to_hhmmss, parse_time_to_seconds
+from src.backends import BACKENDS, default_backend
+from src.cache import ResultCache, cache_from_env, normalize_range
+from src.storage import Storage, storage_from_env
+from src.transcript_index import TranscriptIndex, index_from_env
+from src.jobs import BackgroundTask, BackgroundTasks
+from src.metrics import Trace
+from src.summarize import summarize_local_long, summarize_openai_long
+from src.model_pool import preload_models_from_env
 from dotenv import load_dotenv
+from typing import Optional, Tuple
 from urllib.error import HTTPError
 
 
@@ -15,6 +24,156 @@ def save_config(config):
         config.write(configfile)
 
 
+# Objects below are created once per server and shared by all sessions and reruns
+@st.cache_resource
+def warm_models() -> bool:
+    # Models stay in the process-wide pool, so they are loaded only on the first run
+    preload_models_from_env()
+    return True
+
+
+@st.cache_resource
+def result_cache() -> ResultCache:
+    return cache_from_env()
+
+
+@st.cache_resource
+def audio_storage() -> Storage:
+    # files left by crashed runs are removed on the first run
+    storage = storage_from_env()
+    storage.cleanup()
+    return storage
+
+
+@st.cache_resource
+def segments_index() -> TranscriptIndex:
+    return index_from_env()
+
+
+@st.cache_resource
+def background_tasks() -> BackgroundTasks:
+    return BackgroundTasks(max_workers=int(os.getenv("APP_WORKERS", "1")))
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cached_video_info(youtube_url: str, proxy_str: Optional[str]) -> Tuple:
+    # every widget change reruns the page, video information is requested once per link
+    return video_info(youtube_url, proxy_str)
+
+
+def analyze_video(task: BackgroundTask, cache: ResultCache, storage: Storage, transcript_index: TranscriptIndex,
+                  youtube_url: str, file_name: str, video_title: str, video_length: int, whisper_model: str,
+                  backend: str, clip_range: Optional[Tuple],
+                  proxy_str: Optional[str], summary_backend: Optional[str] = None,
+                  summary_model: Optional[str] = None, openai_api_key: Optional[str] = None) -> dict:
+    """
+    Download, transcribe and summarize video. Runs in background thread, progress and recognized text
+    are reported to the task, so the page shows them while it is rerun.
+    """
+    # Every stage of the run is measured to show timing breakdown
+    with Trace() as trace:
+        # Transcript could be made before for the same video, model and clip range
+        summary = cache.get_transcript(file_name, whisper_model, clip_range, backend)
+        if summary is None:
+            summary = transcribe_video(task, cache, storage, transcript_index, youtube_url, file_name, video_title,
+                                       video_length, whisper_model, backend, clip_range, proxy_str)
+        if summary_backend:
+            # Summarize
+            task.update(stage="Суммаризация...")
+            transcript = summary
+            try:
+                summary = cache.get_summary(transcript, summary_backend, summary_model)
+                if summary is None:
+                    if summary_backend == "openai":
+                        summary = summarize_openai_long(transcript, summary_model, openai_api_key)
+                    else:
+                        # answer is shown on the page while it is generated
+                        summary = summarize_local_long(transcript, on_text=lambda text: task.update(text=text))
+                    cache.put_summary(transcript, summary_backend, summary_model, summary)
+            except Exception as e:
+                raise RuntimeError(f"Ошибка суммаризации. Пожалуйста, попробуйте еще раз!\nТекст ошибки: {e}") from e
+    return {"text": summary, "breakdown": trace.breakdown(), "total_seconds": trace.total_seconds()}
+
+
+def transcribe_video(task: BackgroundTask, cache: ResultCache, storage: Storage, transcript_index: TranscriptIndex,
+                     youtube_url: str, file_name: str, video_title: str, video_length: int, whisper_model: str,
+                     backend: str, clip_range: Optional[Tuple], proxy_str: Optional[str]) -> str:
+    # Download audio
+    try:
+        # Downloaded and compact audio files are kept in the runtimes folder within
+        # STORAGE_MAX_MB, example: runtimes/XxCZC5dF8D8.opus. Files are checked before reuse
+        compact_name = compact_audio_name(file_name)
+        download_name = f"{file_name}.mp4"
+        keep_name = None
+        source_path = storage.get(compact_name)
+        if source_path is None:
+            source_path = storage.get(download_name)
+            if source_path is not None:
+                keep_name = compact_name
+            elif clip_range:
+                # for the clip only needed byte ranges are fetched from the stream, nothing is saved
+                source_path = audio_stream_url(youtube_url, proxy_str)
+            else:
+                task.update(stage="Скачиваю видео...")
+                with storage.write(download_name) as tmp_path:
+                    download_audio(youtube_url, download_path=tmp_path)
+                source_path, keep_name = storage.path(download_name), compact_name
+        if clip_range:
+            # compact copy is made only for the whole audio, so the download is kept
+            keep_name = None
+    except HTTPError:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        print(f"type: {type(e)}")
+        print(f"e.args: {e.args}")
+        raise RuntimeError("Пожалуйста, предоставьте корректную ссылку на видео!") from e
+
+    # Transcribe chunk by chunk, decoding only requested range of the audio
+    keep_path = storage.temp_path(keep_name) if keep_name else None
+    try:
+        start = parse_time_to_seconds(clip_range[0]) if clip_range else 0
+        end = parse_time_to_seconds(clip_range[1]) if clip_range else None
+        length = (end if clip_range else video_length) - start
+        segments = []
+        parts = []
+        task.update(stage="Распознавание аудио...")
+        for segment in transcribe_stream(source_path, whisper_model, start, end, keep_compact_path=keep_path,
+                                         proxy=proxy_str, backend=backend):
+            segments.append(segment)
+            parts.append(segment["text"])
+            done = min((segment["end"] - start) / max(length, 1), 1.0)
+            task.update(progress=done, stage=f"Распознано {int(done * 100)}%", text="".join(parts))
+        summary = "".join(parts)
+        print("Transcribe is done")
+        if keep_path:
+            storage.commit(keep_path, keep_name)
+            storage.remove(download_name)
+        cache.put_transcript(file_name, whisper_model, summary, clip_range, backend)
+        # segments can be searched and summarized by time window in the search panel
+        transcript_index.add_segments(file_name, segments, video_title)
+    except Exception as e:
+        print(e)
+        raise RuntimeError("Ошибка распознавания. Пожалуйста, попробуйте еще раз!") from e
+    finally:
+        if keep_path:
+            storage.discard(keep_path)
+    return summary
+
+
+@st.fragment(run_every=1)
+def show_progress(task: BackgroundTask):
+    """
+    Polls running task every second without rerunning the whole page.
+    """
+    state = task.snapshot()
+    if state["status"] != "running":
+        # the whole page is rerun to show the result
+        st.rerun()
+    st.progress(state["progress"], text=state["stage"] or "Анализ видео...")
+    st.text_area(label="Результат", value=state["text"].strip(), height=500)
+
+
 def main():
     # Load config
     config = configparser.ConfigParser()
@@ -23,11 +182,23 @@ def main():
     # Load .env
     load_dotenv()
 
+    # Models, cache of transcripts and summaries, downloaded audio files and background tasks
+    # are shared by all reruns
+    warm_models()
+    cache = result_cache()
+    storage = audio_storage()
+    transcript_index = segments_index()
+    tasks = background_tasks()
+
     # Setup streamlit
     st.set_page_config(layout="wide")
     st.title("Видео Суммаризатор")
     col1, col2 = st.columns([3, 7], gap='medium')
-    summary = video_title = ""
+    summary = video_title = file_name = ""
+    with col2:
+        # Placeholders are filled at the end of the run, result also shows progress of running analysis
+        title_placeholder = st.empty()
+        result_placeholder = st.empty()
 
     with col1:
         with st.expander("Настройки", False):
@@ -36,6 +207,11 @@ def main():
                                                 ("turbo", "small", "medium", "large"),
                                                 index=0,
                                                 key='whisper_model_select')
+            # Transcription engine selector (faster-whisper is int8 quantized and much faster on CPU)
+            backend_select = st.selectbox("Выберите движок для распознавания аудио",
+                                          tuple(BACKENDS),
+                                          index=tuple(BACKENDS).index(default_backend()),
+                                          key='backend_select')
             # Checkbox for turn off summary (transcribe only mode) # TEXT SUMMARY
             summarize_checkbox = st.checkbox("Суммировать текст", value=False)
             if summarize_checkbox:
@@ -75,6 +251,63 @@ def main():
                 proxy_login = st.text_input("Логин", login, help="Логин для прокси (если нужно)", key="proxy_login")
                 proxy_password = st.text_input("Пароль", password, help="Пароль для прокси (если нужно)", key="proxy_password", type="password")
 
+        # Search in transcripts of processed videos, found part can be summarized without new transcription
+        with st.expander("Поиск по расшифровкам", False):
+            search_query = st.text_input("Фраза", key="search_query")
+            hits = transcript_index.search(search_query) if search_query else []
+            if search_query and not hits:
+                st.info("Ничего не найдено в обработанных видео")
+            for hit in hits:
+                start = int(hit["start"])
+                timestamp = parse_time_to_hhmmss(start)
+                # files uploaded to the bot have no link
+                if not hit["video_id"].startswith("upload_"):
+                    timestamp = f"[{timestamp}](https://youtu.be/{hit['video_id']}?t={start})"
+                st.markdown(f"{timestamp} **{hit['title'] or hit['video_id']}**: {hit['snippet']}")
+            if hits:
+                hit = st.selectbox("Фрагмент для суммаризации", hits,
+                                   format_func=lambda h: f"{parse_time_to_hhmmss(int(h['start']))} "
+                                                         f"{h['title'] or h['video_id']}",
+                                   key="search_hit")
+                window_col1, window_col2 = st.columns(2)
+                with window_col1:
+                    window_start = st.text_input("С", parse_time_to_hhmmss(max(0, int(hit["start"]) - 60)),
+                                                 key="window_start")
+                with window_col2:
+                    window_end = st.text_input("ПО", parse_time_to_hhmmss(int(hit["end"]) + 60), key="window_end")
+                if st.button("Суммировать фрагмент"):
+                    if not summarize_checkbox:
+                        st.error("Выберите модель в настройках: включите «Суммировать текст»")
+                        st.stop()
+                    try:
+                        window_text = transcript_index.window_text(hit["video_id"], parse_time_to_seconds(window_start),
+                                                                   parse_time_to_seconds(window_end))
+                    except (ValueError, IndexError):
+                        st.error("Введите время в правильном формате, например: 0:30, 12:03, 01:12:04")
+                        st.stop()
+                    if not window_text:
+                        st.error("Этот фрагмент видео еще не распознан")
+                        st.stop()
+                    if summary_method_select == "OpenAI API":
+                        window_backend, window_model = "openai", openai_model_select
+                    else:
+                        window_backend, window_model = "local", "summarize_local"
+                    with st.spinner("Суммаризация..."):
+                        try:
+                            window_summary = cache.get_summary(window_text, window_backend, window_model)
+                            if window_summary is None:
+                                if window_backend == "openai":
+                                    window_summary = summarize_openai_long(
+                                        window_text, window_model,
+                                        openai_api_key or st.session_state.get("openai_api_key_input") or None)
+                                else:
+                                    window_summary = summarize_local_long(window_text)
+                                cache.put_summary(window_text, window_backend, window_model, window_summary)
+                        except Exception as e:
+                            st.error(f"Ошибка суммаризации. Пожалуйста, попробуйте еще раз!\nТекст ошибки: {e}")
+                            st.stop()
+                    st.write(window_summary)
+
         # Paste url to youtube video
         youtube_url = st.text_input("Вставьте ссылку на видеоролик в youtube:")
 
@@ -101,7 +334,7 @@ def main():
                 proxy_str = None
             # Get information about video
             try:
-                file_name, video_title, video_length = video_info(youtube_url, proxy_str)
+                file_name, video_title, video_length = cached_video_info(youtube_url, proxy_str)
             except Exception as e:
                 print(e)
                 st.error(e)
@@ -126,84 +359,51 @@ def main():
                     st.error(f"Некорректные временные отрезки для видео. Длина видео {parsed_length}")
                     st.stop()
 
-            # create 'Analyze' button
-            transcribe_button = st.empty()
-            progress_placeholder = st.empty()
-
-            # Button to download audio from YouTube video
-            if transcribe_button.button("Анализировать видео"):
-                # Download audio
-                try:
-                    transcribe_button.empty()
-                    # All mp4 and mp3 files will be saved in the runtimes folder
-                    # example: runtimes/XxCZC5dF8D8.mp3
-                    if not os.path.exists("runtimes/"):
-                        os.mkdir("runtimes")
-                    convert_path = f"runtimes/{file_name}.mp3"
-                    # download file if wasn't downloaded before
-                    if not os.path.exists(convert_path):
-                        download_path = f"runtimes/{file_name}.mp4"
-                        with st.spinner("Скачиваю видео..."):
-                            download_audio(youtube_url, download_path=download_path)
-                        with st.spinner("Конвертирую в mp3..."):
-                            convert_mp4_to_mp3(download_path, convert_path)
-                    # change file name if user wants to clip video
-                    if clip_video:
-                        original_path = convert_path
-                        convert_path = f"runtimes/{file_name}_clip.mp3"
-                        timing = start_time, end_time if end_time != parsed_length or end_time != "" else ""
-                        trim_video(original_path, convert_path, timing)
-                except HTTPError as e:
-                    print(f"Error: {e}")
-                    st.error(e)
-                    transcribe_button.empty()
-                    progress_placeholder.empty()
-                    st.stop()
-                except Exception as e:
-                    print(f"Error: {e}")
-                    print(f"type: {type(e)}")
-                    print(f"e.args: {e.args}")
-                    st.error("Пожалуйста, предоставьте корректную ссылку на видео!")
-                    transcribe_button.empty()
-                    progress_placeholder.empty()
-                    st.stop()
-
-                # Transcribe
-                try:
-                    progress_placeholder.empty()
-                    with st.spinner("Распознавание аудио..."):
-                        summary = transcribe(convert_path, model_name=whisper_model_select)
-                        print("Transcribe is done")
-                except Exception as e:
-                    print(e)
-                    st.error("Ошибка распознавания. Пожалуйста, попробуйте еще раз!")
-                    st.stop()
+            clip_range = (start_time, end_time) if clip_video else None
+            summary_backend = summary_model = None
+            if summarize_checkbox:
+                if summary_method_select == "OpenAI API":
+                    summary_backend, summary_model = "openai", openai_model_select
+                else:
+                    summary_backend, summary_model = "local", "summarize_local"
 
+            # Button to analyze video. Analysis runs in background, so reruns of the page don't restart it,
+            # and the same video with the same settings is analyzed once
+            if st.button("Анализировать видео"):
+                task_key = (file_name, whisper_model_select, backend_select, normalize_range(clip_range),
+                            summary_backend, summary_model)
+                tasks.submit(task_key, analyze_video, cache, storage, transcript_index, youtube_url, file_name,
+                             video_title, video_length,
+                             whisper_model_select, backend_select, clip_range, proxy_str,
+                             summary_backend, summary_model, openai_api_key if summary_backend == "openai" else None)
+                st.session_state["task_key"] = task_key
                 if summarize_checkbox:
-                    # Summarize
-                    try:
-                        transcribe_button.empty()
-                        progress_placeholder.text("Суммаризация...")
-                        if summary_method_select == "OpenAI API":
-                            summary = summarize_openai_text(summary, openai_model_select, openai_api_key)
-                            config.set("Settings", "openai_model", openai_model_select)
-                        else:
-                            summary = local_llm.summarize_local(summary)
-                        # Save settings
-                        config.set("Settings", "whisper", whisper_model_select)
-                        config.set("Settings", "summary_method", summary_method_select)
-                        save_config(config)
-                        # return Analyze button
-                        transcribe_button.button("Анализировать видео")
-                    except Exception as e:
-                        st.error(f"Ошибка суммаризации. Пожалуйста, попробуйте еще раз!\nТекст ошибки: {e}")
-                        progress_placeholder.empty()
-                        st.stop()
-                progress_placeholder.empty()
+                    if summary_method_select == "OpenAI API":
+                        config.set("Settings", "openai_model", openai_model_select)
+                    # Save settings
+                    config.set("Settings", "whisper", whisper_model_select)
+                    config.set("Settings", "summary_method", summary_method_select)
+                    save_config(config)
 
-    with col2:
-        title_placeholder = st.empty() if video_title == "" else st.subheader(f"Название видео: {video_title}")
-        summ_text = st.text_area(label="Результат", value=summary.strip(), height=500)
+        # The last analysis started in this session is shown while its video is selected
+        task_key = st.session_state.get("task_key")
+        task = tasks.get(task_key) if task_key and task_key[0] == file_name else None
+        state = task.snapshot() if task else None
+        if state and state["status"] == "error":
+            st.error(state["error"])
+        if state and state["status"] == "done":
+            summary = state["result"]["text"]
+            with st.expander("Время этапов", False):
+                st.table(state["result"]["breakdown"])
+                st.caption(f"Сумма по этапам: {state['result']['total_seconds']} с")
+
+    if video_title != "":
+        title_placeholder.subheader(f"Название видео: {video_title}")
+    if state and state["status"] == "running":
+        with result_placeholder.container():
+            show_progress(task)
+    else:
+        result_placeholder.text_area(label="Результат", value=summary.strip(), height=500)
 
 
 if __name__ == "__main__":
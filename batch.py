@@ -0,0 +1,63 @@
+# Summarize many videos, playlists or channels in one run
+#
+# Usage: python batch.py "https://www.youtube.com/playlist?list=PL..." links.txt --output runtimes/batch.jsonl
+# Interrupted run is resumed by running the same command again.
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from dotenv import load_dotenv
+
+from src.backends import default_backend
+from src.batch import BatchRunner, expand_sources
+from src.cache import cache_from_env
+from src.jobs import job_queue_from_env
+from src.openai_service import summarization_service_from_env
+from src.storage import storage_from_env
+from src.transcript_index import index_from_env
+
+
+async def run(args) -> None:
+    proxy = None
+    if os.getenv("PROXY_VS"):
+        proxy = f"http://{os.getenv('PROXY_VS_LOGIN')}:{os.getenv('PROXY_VS_PASSWORD')}@{os.getenv('PROXY_VS')}"
+    urls = expand_sources(args.sources, proxy)
+    job_queue = job_queue_from_env(preload_models=[args.model], preload_backend=args.backend)
+    summarizer = summarization_service_from_env(os.getenv("OPEN_AI_KEY"))
+    storage = storage_from_env()
+    storage.cleanup()
+    runner = BatchRunner(job_queue, cache_from_env(), storage, summarizer, args.output, model_name=args.model,
+                         backend=args.backend, openai_model=args.openai_model, proxy=proxy,
+                         download_workers=args.download_workers, download_ahead=args.download_ahead,
+                         transcript_index=index_from_env())
+    await job_queue.start()
+    try:
+        counts = await runner.run(urls)
+    finally:
+        await job_queue.stop()
+        await summarizer.aclose()
+    print(f"Done: {counts['ok']}, failed: {counts['error']}, already done before: {counts['skipped']}. "
+          f"Results are in {args.output}")
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Summarize many YouTube videos into JSONL file")
+    parser.add_argument("sources", nargs="+", help="video, playlist or channel links, or text files with links")
+    parser.add_argument("--output", default="runtimes/batch.jsonl")
+    parser.add_argument("--model", default="turbo", help="whisper model")
+    parser.add_argument("--backend", default=default_backend(), help="transcription backend")
+    parser.add_argument("--openai-model", default="gpt-4o")
+    parser.add_argument("--download-workers", type=int, default=2)
+    parser.add_argument("--download-ahead", type=int, default=2,
+                        help="how many downloaded videos can wait for transcription")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
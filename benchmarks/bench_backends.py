@@ -0,0 +1,58 @@
+# Compare transcription backends: load time, real-time factor and peak memory per backend and model
+#
+# Usage: python -m benchmarks.bench_backends path/to/audio.opus --models small turbo
+import argparse
+import json
+import time
+
+from benchmarks.fixtures import audio_fixture
+from benchmarks.harness import peak_rss_mb, run_isolated
+from src.backends import BACKENDS
+
+
+def _run(backend_name: str, model_name: str, audio_path: str, device: str) -> dict:
+    from src.backends import get_backend
+    from src.utils import load_audio
+
+    audio = load_audio(audio_path)
+    duration = len(audio) / 16000
+    baseline = peak_rss_mb()
+    backend = get_backend(backend_name)
+
+    started = time.perf_counter()
+    model = backend.load(model_name, device)
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    text = backend.transcribe(model, audio)["text"]
+    transcribe_seconds = time.perf_counter() - started
+
+    return {"backend": backend_name, "model": model_name, "device": device,
+            "load_seconds": round(load_seconds, 2), "transcribe_seconds": round(transcribe_seconds, 2),
+            "rtf": round(transcribe_seconds / duration, 3),
+            "peak_rss_mb": round(peak_rss_mb()), "model_rss_mb": round(peak_rss_mb() - baseline),
+            "chars": len(text)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription backends")
+    parser.add_argument("audio", nargs="?", help="audio file to transcribe, synthetic speech by default")
+    parser.add_argument("--minutes", type=float, default=1, help="length of synthetic audio")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--models", nargs="+", default=["small"])
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    audio = args.audio or audio_fixture(args.minutes)
+    results = []
+    for backend_name in args.backends:
+        for model_name in args.models:
+            # fresh process for every run, so peak memory belongs to one backend and model only
+            results.append(run_isolated(_run, backend_name, model_name, audio, args.device))
+            print(json.dumps(results[-1]))
+
+    print(json.dumps({"audio": audio, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Compare wall-clock time of single transcribe() call with transcribe_parallel() on CPU
+#
+# Usage: python -m benchmarks.bench_parallel runtimes/XxCZC5dF8D8.opus --model small --workers 2 4
+import argparse
+import json
+import os
+import time
+
+from benchmarks.fixtures import audio_fixture
+from src.model_pool import model_pool
+from src.utils import audio_duration, transcribe, transcribe_parallel
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel CPU transcription")
+    parser.add_argument("audio", nargs="?", help="audio file to transcribe, synthetic speech by default")
+    parser.add_argument("--minutes", type=float, default=10, help="length of synthetic audio")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--window", type=int, default=300, help="window length in seconds")
+    parser.add_argument("--overlap", type=int, default=10, help="overlap of windows in seconds")
+    args = parser.parse_args()
+
+    args.audio = args.audio or audio_fixture(args.minutes)
+    duration = audio_duration(args.audio)
+    cpu_count = os.cpu_count() or 1
+    results = []
+
+    # warm up the model, so loading time isn't measured
+    model_pool.preload([args.model])
+    started = time.perf_counter()
+    transcribe(args.audio, args.model)
+    single = time.perf_counter() - started
+    results.append({"mode": "single", "workers": 1, "threads": cpu_count, "seconds": round(single, 2),
+                    "rtf": round(single / duration, 3), "speedup": 1.0})
+
+    for workers in args.workers:
+        threads = max(1, cpu_count // workers)
+        # first call starts worker processes and loads models in them
+        transcribe_parallel(args.audio, args.model, workers, threads, args.window, args.overlap, end=min(duration, 5))
+        started = time.perf_counter()
+        transcribe_parallel(args.audio, args.model, workers, threads, args.window, args.overlap)
+        elapsed = time.perf_counter() - started
+        results.append({"mode": "parallel", "workers": workers, "threads": threads, "seconds": round(elapsed, 2),
+                        "rtf": round(elapsed / duration, 3), "speedup": round(single / elapsed, 2)})
+
+    print(json.dumps({"audio": args.audio, "duration": duration, "model": args.model, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Cold start of the entry points: import time, memory and heavy modules loaded before the first request
+#
+# Usage: python -m benchmarks.bench_startup --repeat 5
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("torch", "whisper", "faster_whisper", "moviepy", "pytube", "transformers")
+# every import runs in fresh interpreter, so nothing is cached between runs
+CHILD = """
+import importlib, json, resource, sys, time
+started = time.perf_counter()
+importlib.import_module(sys.argv[1])
+seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "heavy": [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def _import_once(module: str, env: dict, importtime: bool = False) -> dict:
+    cmd = [sys.executable, *(["-X", "importtime"] if importtime else []), "-c", CHILD, module, *HEAVY_MODULES]
+    result = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+    row = json.loads(result.stdout.strip().splitlines()[-1])
+    if importtime:
+        row["slowest"] = _slowest_imports(result.stderr)
+    return row
+
+
+def _slowest_imports(report: str, top: int = 10) -> list:
+    # lines of -X importtime: "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in report.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        # only top level imports (indented by one space), nested ones are included in cumulative time
+        if len(name) - len(name.lstrip()) == 1:
+            rows.append((int(parts[1]) / 1e6, name.strip()))
+    return [{"module": name, "seconds": round(seconds, 3)} for seconds, name in sorted(rows, reverse=True)[:top]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold start of main.py and app.py")
+    parser.add_argument("--modules", nargs="+", default=["main", "app"],
+                        help="entry points, heavy dependencies are measured for comparison")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--importtime", action="store_true", help="show the slowest top level imports")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # main.py creates the bot on import, token only has to look valid
+    env.setdefault("BOT_TOKEN", "123456789:" + "A" * 35)
+    results = []
+    for module in [*args.modules, *HEAVY_MODULES]:
+        runs = [_import_once(module, env) for _ in range(args.repeat)]
+        runs = [run for run in runs if "error" not in run] or runs[:1]
+        if "error" in runs[0]:
+            row = {"module": module, **runs[0]}
+        else:
+            row = {"module": module,
+                   "seconds_median": round(statistics.median(run["seconds"] for run in runs), 3),
+                   "rss_mb_median": round(statistics.median(run["rss_mb"] for run in runs)),
+                   "heavy_modules_loaded": runs[0]["heavy"]}
+            if args.importtime:
+                row["slowest"] = _import_once(module, env, importtime=True).get("slowest")
+        results.append(row)
+        print(json.dumps(row))
+    print(json.dumps({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# Synthetic audio fixtures for benchmarks, generated locally without network
+import os
+import subprocess
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _tone(seconds: float, seed: int) -> np.ndarray:
+    # sum of slowly changing sine tones
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    rng = np.random.default_rng(seed)
+    audio = np.zeros_like(t)
+    for frequency in rng.uniform(200, 1200, 3):
+        audio += np.sin(2 * np.pi * frequency * t + rng.uniform(0, np.pi))
+    return 0.1 * audio
+
+
+def _speech_like(seconds: float, seed: int) -> np.ndarray:
+    # harmonics of changing pitch, modulated by ~4 Hz syllable envelope, with pauses between phrases
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    t = np.arange(samples) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t) + 10 * np.sin(2 * np.pi * 2.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4 * t + rng.uniform(0, np.pi)))
+    phrases = ((t % 6) < 4.5).astype(np.float32)
+    noise = 0.02 * rng.standard_normal(samples)
+    return 0.15 * voice * syllables * phrases + noise
+
+
+SIGNALS = {"tone": _tone, "speech": _speech_like}
+
+
+def _pcm16(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+
+
+def audio_fixture(minutes: float, kind: str = "speech", container: str = "m4a", seed: int = 0) -> str:
+    """
+    Path to synthetic audio of given length, generated on first use and kept in benchmarks/fixtures.
+    container is 'wav' or anything ffmpeg can encode, 'm4a' looks like audio downloaded from YouTube.
+
+    Examples
+    --------
+    path = audio_fixture(10, "speech")
+    """
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    name = f"{kind}_{minutes:g}min_{seed}"
+    wav_path = os.path.join(FIXTURES_DIR, f"{name}.wav")
+    if not os.path.exists(wav_path):
+        # generated and written minute by minute to keep memory low for long fixtures
+        with wave.open(f"{wav_path}.part", "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(SAMPLE_RATE)
+            for minute in range(int(np.ceil(minutes))):
+                seconds = min(60.0, minutes * 60 - minute * 60)
+                f.writeframes(_pcm16(SIGNALS[kind](seconds, seed + minute)))
+        os.replace(f"{wav_path}.part", wav_path)
+    if container == "wav":
+        return wav_path
+    path = os.path.join(FIXTURES_DIR, f"{name}.{container}")
+    if not os.path.exists(path):
+        cmd = ["ffmpeg", "-nostdin", "-y", "-loglevel", "error", "-i", wav_path, "-ac", "1", "-b:a", "128k",
+               "-f", "mp4" if container == "m4a" else container, f"{path}.part"]
+        subprocess.run(cmd, check=True)
+        os.replace(f"{path}.part", path)
+    return path
+
+
+def transcript_fixture(minutes: float, words_per_minute: int = 150, seed: int = 0) -> str:
+    """
+    Synthetic transcript of the same length as speech of given duration, for summarization stage.
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = ("видео", "модель", "данные", "сегодня", "расскажу", "важно", "пример", "результат",
+                  "вопрос", "система", "работает", "быстро", "процесс", "время", "решение", "задача")
+    words = rng.choice(vocabulary, int(minutes * words_per_minute))
+    sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+    return " ".join(sentences)
@@ -0,0 +1,32 @@
+# Helpers to measure benchmark stages in isolated processes
+import multiprocessing
+import resource
+import time
+from typing import Callable
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(func: Callable, args: tuple) -> dict:
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    result = func(*args) or {}
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    result["peak_rss_mb"] = round(peak_rss_mb())
+    result["baseline_rss_mb"] = round(baseline)
+    return result
+
+
+def run_isolated(func: Callable, *args) -> dict:
+    """
+    Run function in fresh process, so peak memory belongs to this stage only.
+    Returns dict returned by the function with wall time and peak RSS added, or error.
+    """
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        try:
+            return pool.apply(_measure, (func, args))
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}"}
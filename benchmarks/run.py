@@ -0,0 +1,159 @@
+# End-to-end benchmark of pipeline stages on synthetic audio, runs offline on CPU
+#
+# Usage: python -m benchmarks.run --minutes 1 10 60 --models tiny small --baseline benchmarks/results/old.json
+# Transcription needs model files already downloaded (~/.cache/whisper, ~/.cache/huggingface).
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+from benchmarks.fixtures import FIXTURES_DIR, audio_fixture, transcript_fixture
+from benchmarks.harness import run_isolated
+from benchmarks.stub_llm import start_stub_server
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+STAGES = ("decode", "convert", "trim", "range_decode", "transcribe", "summarize")
+
+
+def stage_decode(path: str) -> dict:
+    from src.utils import SAMPLE_RATE, load_audio
+    audio = load_audio(path)
+    return {"audio_seconds": round(len(audio) / SAMPLE_RATE, 3)}
+
+
+def stage_convert(path: str, minutes: float) -> dict:
+    from src.utils import convert_mp4_to_mp3
+    output_path = os.path.join(FIXTURES_DIR, f"bench_{minutes:g}min.mp3")
+    convert_mp4_to_mp3(path, output_path, remove_input=False)
+    return {"audio_seconds": minutes * 60, "bytes": os.path.getsize(path)}
+
+
+def stage_trim(path: str, minutes: float) -> dict:
+    # legacy clip path: mp3 is decoded by MoviePy and the second half is re-encoded
+    from src.utils import convert_mp4_to_mp3, parse_time_to_hhmmss, trim_video
+    mp3_path = os.path.join(FIXTURES_DIR, f"bench_{minutes:g}min.mp3")
+    if not os.path.exists(mp3_path):
+        convert_mp4_to_mp3(path, mp3_path, remove_input=False)
+    start = int(minutes * 30)
+    trim_video(mp3_path, os.path.join(FIXTURES_DIR, f"bench_{minutes:g}min_clip.mp3"),
+               (parse_time_to_hhmmss(start), parse_time_to_hhmmss(int(minutes * 60))))
+    return {"audio_seconds": minutes * 60 - start}
+
+
+def stage_range_decode(path: str, minutes: float) -> dict:
+    # clip path of the current pipeline: ffmpeg seeks to the second half and decodes only it
+    from src.utils import SAMPLE_RATE, load_audio
+    audio = load_audio(path, start=minutes * 30, end=minutes * 60)
+    return {"audio_seconds": round(len(audio) / SAMPLE_RATE, 3)}
+
+
+def stage_transcribe(path: str, model_name: str, backend: str) -> dict:
+    from src.model_pool import model_pool
+    from src.utils import audio_duration, transcribe
+    started = time.perf_counter()
+    model_pool.preload([model_name], "cpu", backend)
+    load_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    transcribe(path, model_name, backend=backend)
+    transcribe_seconds = time.perf_counter() - started
+    return {"audio_seconds": audio_duration(path), "model": model_name, "backend": backend,
+            "model_load_seconds": round(load_seconds, 3), "transcribe_seconds": round(transcribe_seconds, 3)}
+
+
+def stage_summarize(minutes: float, base_url: str, model: str) -> dict:
+    os.environ["OPENAI_BASE_URL"] = base_url
+    from src.summarize import count_tokens, summarize_openai_long
+    text = transcript_fixture(minutes)
+    summarize_openai_long(text, model, api_key="stub")
+    return {"audio_seconds": minutes * 60, "tokens": count_tokens(text, model), "model": model}
+
+
+def _with_rtf(result: dict) -> dict:
+    seconds = result.get("transcribe_seconds", result.get("seconds"))
+    if result.get("audio_seconds") and seconds is not None:
+        result["rtf"] = round(seconds / result["audio_seconds"], 4)
+    return result
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def _compare(results: list, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    def key(row):
+        return row["stage"], row["minutes"], row.get("model"), row.get("backend")
+
+    previous = {key(row): row for row in baseline}
+    print(f"\nCompared with {baseline_path}:")
+    for row in results:
+        old = previous.get(key(row))
+        if old and "seconds" in old and "seconds" in row:
+            print(f"{row['stage']:>13} {row['minutes']:>5g} min {row.get('model') or '':>8}: "
+                  f"{old['seconds']:.2f}s -> {row['seconds']:.2f}s ({row['seconds'] / max(old['seconds'], 1e-9):.2f}x), "
+                  f"RSS {old.get('peak_rss_mb')} -> {row.get('peak_rss_mb')} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic audio")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 10, 60], help="fixture lengths")
+    parser.add_argument("--transcribe-minutes", type=float, nargs="+", default=[1, 10],
+                        help="fixture lengths for transcription, long ones take a lot of time on CPU")
+    parser.add_argument("--kind", default="speech", choices=("speech", "tone"))
+    parser.add_argument("--models", nargs="+", default=["tiny"])
+    parser.add_argument("--backends", nargs="+", default=["whisper"])
+    parser.add_argument("--summary-model", default="gpt-3.5-turbo")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--output", help="JSON file for results, by default benchmarks/results/<time>.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare with")
+    args = parser.parse_args()
+
+    server = start_stub_server(latency=0.2)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    results = []
+
+    def record(stage: str, minutes: float, result: dict) -> None:
+        row = _with_rtf({"stage": stage, "minutes": minutes, **result})
+        results.append(row)
+        print(json.dumps(row, ensure_ascii=False))
+
+    for minutes in args.minutes:
+        path = audio_fixture(minutes, args.kind)
+        if "decode" in args.stages:
+            record("decode", minutes, run_isolated(stage_decode, path))
+        if "convert" in args.stages:
+            record("convert", minutes, run_isolated(stage_convert, path, minutes))
+        if "trim" in args.stages:
+            record("trim", minutes, run_isolated(stage_trim, path, minutes))
+        if "range_decode" in args.stages:
+            record("range_decode", minutes, run_isolated(stage_range_decode, path, minutes))
+        if "summarize" in args.stages:
+            record("summarize", minutes, run_isolated(stage_summarize, minutes, base_url, args.summary_model))
+    if "transcribe" in args.stages:
+        for minutes in args.transcribe_minutes:
+            path = audio_fixture(minutes, args.kind)
+            for backend in args.backends:
+                for model_name in args.models:
+                    record("transcribe", minutes, run_isolated(stage_transcribe, path, model_name, backend))
+    server.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": _meta(), "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Results saved to {output}")
+    if args.baseline:
+        _compare(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# OpenAI-compatible stub server for offline benchmarks and tests of summarization
+#
+# Usage: python -m benchmarks.stub_llm --port 8000, then set OPENAI_BASE_URL = 'http://127.0.0.1:8000/v1'
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    # server attributes: latency (seconds per request), fail_every (answer 429 on every N-th request)
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            number = server.requests
+        if server.fail_every and number % server.fail_every == 0:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "0"})
+            return
+        time.sleep(server.latency)
+        prompt = request["messages"][-1]["content"]
+        prompt_tokens = len(prompt) // 4 + 1
+        answer = f"Summary of {len(prompt)} characters."
+        self._send(200, {
+            "id": f"chatcmpl-stub-{number}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": answer}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 8, "total_tokens": prompt_tokens + 8},
+        })
+
+    def _send(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port: int = 0, latency: float = 0.2, fail_every: int = 0) -> ThreadingHTTPServer:
+    """
+    Start stub server in background thread, port 0 picks free port.
+
+    Examples
+    --------
+    server = start_stub_server()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubLLMHandler)
+    server.latency = latency
+    server.fail_every = fail_every
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--fail-every", type=int, default=0)
+    args = parser.parse_args()
+    server = start_stub_server(args.port, args.latency, args.fail_every)
+    print(f"Stub LLM server at http://127.0.0.1:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,29 @@
 import asyncio
 import logging
+import mimetypes
 import os
 import re
 import sys
+import time
+from contextlib import aclosing
+from typing import Optional
 
 from tgbot.tgbot import dp, bot
-from aiogram.filters import CommandStart
+from aiogram.filters import Command, CommandObject, CommandStart
 from aiogram.types import Message
 from aiogram.enums import ContentType
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramRetryAfter
 from aiogram import html
 
-from src.utils import convert_mp4_to_mp3, download_audio, is_youtube_url, summarize_openai_text, transcribe, video_info
+from src.backends import default_backend
+from src.cache import cache_from_env
+from src.metrics import Trace, metrics, span, start_metrics_server
+from src.jobs import QueueFullError, RequestCoalescer, UserLimitError, job_queue_from_env
+from src.storage import storage_from_env
+from src.transcript_index import index_from_env
+from src.utils import audio_duration, compact_audio_name, download_audio, is_youtube_url, parse_time_to_hhmmss, \
+    parse_time_to_seconds, transcribe_stream, video_info, youtube_video_id
+from src.openai_service import summarization_service_from_env
 from dotenv import load_dotenv
 
 
@@ -23,6 +36,27 @@ ydl_opts = {
     'proxy' : proxy,
 }
 openai_api_key = os.getenv("OPEN_AI_KEY")
+WHISPER_MODEL = "turbo"
+WHISPER_BACKEND = default_backend()
+PROGRESS_INTERVAL = 5
+PROGRESS_TEXT_LENGTH = 500
+OPENAI_MODEL = "gpt-4o"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+job_queue = job_queue_from_env(preload_models=[WHISPER_MODEL], preload_backend=WHISPER_BACKEND)
+cache = cache_from_env()
+storage = storage_from_env()
+transcript_index = index_from_env()
+SEARCH_RESULTS = 10
+# Bot API server gives files up to 20 MB, local server gives bigger ones
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "20"))
+UPLOAD_SINGLE_PASS_MB = int(os.getenv("UPLOAD_SINGLE_PASS_MB", "5"))
+UPLOAD_TIMEOUT = 600
+# documents without audio or video mime type are accepted only with these extensions
+UPLOAD_EXTENSIONS = (".mp3", ".m4a", ".ogg", ".oga", ".opus", ".wav", ".flac", ".aac", ".wma", ".amr",
+                     ".mp4", ".mkv", ".webm", ".mov", ".avi", ".m4v", ".3gp")
+summarizer = summarization_service_from_env(openai_api_key)
+coalescer = RequestCoalescer()
+waiting_tasks = set()
 
 @dp.message(CommandStart())
 async def command_start_handler(message: Message) -> None:
@@ -31,49 +65,305 @@ async def command_start_handler(message: Message) -> None:
     """
     await message.answer(f"Hello, {html.bold(message.from_user.full_name)}! Paste Youtube link to get video summary")
 
-@dp.message()
-async def message_handler(message: Message) -> None:
+
+@dp.message(Command("search"))
+async def search_handler(message: Message, command: CommandObject) -> None:
+    """
+    Search phrase in transcripts of processed videos: /search phrase
+    """
+    if not command.args:
+        await message.answer("Usage: /search phrase")
+        return
+    hits = await job_queue.run_io(transcript_index.search, command.args, limit=SEARCH_RESULTS)
+    if not hits:
+        await message.answer("Nothing found in processed videos")
+        return
+    lines = []
+    for hit in hits:
+        timestamp = parse_time_to_hhmmss(int(hit['start']))
+        # uploaded files have no link
+        if not hit['video_id'].startswith("upload_"):
+            timestamp = f"<a href=\"https://youtu.be/{hit['video_id']}?t={int(hit['start'])}\">{timestamp}</a>"
+        lines.append(f"{timestamp} {html.quote(hit['title'] or hit['video_id'])}\n{html.quote(hit['snippet'])}")
+    await message.answer("\n\n".join(lines) + f"\n\nSummary of a part: /window {hits[0]['video_id']} "
+                         f"{parse_time_to_hhmmss(max(0, int(hits[0]['start']) - 60))} "
+                         f"{parse_time_to_hhmmss(int(hits[0]['end']) + 60)}", disable_web_page_preview=True)
+
+
+@dp.message(Command("window"))
+async def window_handler(message: Message, command: CommandObject) -> None:
     """
-    Message handler which process messages
+    Summarize time window of processed video without transcribing it again: /window <link or id> 10:00 15:00
     """
-    if message.content_type != ContentType.TEXT:
-        await message.answer("You should send me a correct Youtube link")
+    args = (command.args or "").split()
+    usage = "Usage: /window <video link or ID> <from> <to>, e.g. /window XxCZC5dF8D8 10:00 15:30"
+    if len(args) != 3:
+        await message.answer(usage)
+        return
+    video_id = youtube_video_id(args[0]) or args[0]
+    try:
+        start, end = parse_time_to_seconds(args[1]), parse_time_to_seconds(args[2])
+    except (ValueError, IndexError):
+        await message.answer(usage)
+        return
+    text = await job_queue.run_io(transcript_index.window_text, video_id, start, end)
+    if not text:
+        await message.answer("This part of the video wasn't transcribed yet, send me the video link first")
         return
     try:
-        youtube_url = message.text
-        if is_youtube_url(youtube_url):
-            print("passed")
-            file_name, video_title, video_length = video_info(youtube_url, proxy=proxy)
-            print("info received")
-            await message.answer(f"Video ID: {file_name}\nVideo title: {video_title}\nVideo length: {video_length}")
-            # All mp4 and mp3 files will be saved in the runtimes folder
-            # example: runtimes/XxCZC5dF8D8.mp3
-            if not os.path.exists("runtimes/"):
-                os.mkdir("runtimes")
-            convert_path = f"runtimes/{file_name}.mp3"
-            # download file if wasn't downloaded before
-            if not os.path.exists(convert_path):
-                download_path = f"runtimes/{file_name}.mp4"
-                download_audio(youtube_url, download_path=download_path)
-                convert_mp4_to_mp3(download_path, convert_path)
-            # Transcribe
-            summary = transcribe(convert_path, model_name="turbo")
-            summary = summarize_openai_text(summary, "gpt-4o", openai_api_key)
-            await message.answer(f"Video summary:\n{summary}")
-        else:
-            await message.answer("You should send me a correct Youtube link")
+        summary = cache.get_summary(text, "openai", OPENAI_MODEL)
+        if summary is None:
+            summary = await summarizer.summarize(text, OPENAI_MODEL)
+            cache.put_summary(text, "openai", OPENAI_MODEL, summary)
     except Exception as e:
+        await message.answer(f"Error happened!\n {e}")
+        return
+    await message.answer(f"Summary of {args[1]} - {args[2]}:\n{summary}")
+
+
+async def transcribe_with_progress(message: Message, source_path: str, video_length: int,
+                                   keep_path: str = None, chunk_seconds: int = 120) -> list:
+    """
+    Transcribe audio and show progress with the latest recognized text in one updated message.
+    Returns timestamped segments
+    """
+    status = await message.answer("Transcribing...")
+    segments = []
+    parts = []
+    next_update = time.monotonic() + PROGRESS_INTERVAL
+    # model loading, decoding and transcription of chunks run in worker process and their spans are
+    # sent back with segments. aclosing stops the worker process if the job fails before transcription is done
+    async with aclosing(job_queue.run_cpu_stream(transcribe_stream, source_path, model_name=WHISPER_MODEL,
+                                                 chunk_seconds=chunk_seconds, keep_compact_path=keep_path,
+                                                 backend=WHISPER_BACKEND)) as stream:
+        async for segment in stream:
+            segments.append(segment)
+            parts.append(segment["text"])
+            # Telegram limits how often message can be edited
+            if time.monotonic() >= next_update:
+                progress = f"{parse_time_to_hhmmss(int(segment['end']))} / {parse_time_to_hhmmss(video_length)}"
+                tail = "".join(parts)[-PROGRESS_TEXT_LENGTH:]
+                delay = await edit_progress(status, f"Transcribing... {progress}\n\n...{html.quote(tail)}")
+                next_update = time.monotonic() + delay
+    await edit_progress(status, "Transcription is done")
+    return segments
+
+
+async def edit_progress(status: Message, text: str) -> float:
+    """
+    Edit progress message, failed edit doesn't stop the job.
+    Returns seconds to wait before the next edit
+    """
+    try:
+        await status.edit_text(text)
+    except TelegramRetryAfter as e:
+        # flood control, group chats reach the limit of edits quickly
+        logging.warning(f"Progress updates are paused for {e.retry_after}s by flood control")
+        return max(PROGRESS_INTERVAL, e.retry_after)
+    except TelegramBadRequest:
+        # message is not modified or was deleted
+        pass
+    except TelegramAPIError as e:
+        logging.warning(f"Progress update failed: {e}")
+    return PROGRESS_INTERVAL
+
+
+async def process_video(message: Message, youtube_url: str) -> str:
+    """
+    Full pipeline for one video, runs inside job queue worker
+    """
+    file_name, video_title, video_length = await job_queue.run_io(video_info, youtube_url, proxy=proxy)
+    await message.answer(f"Video ID: {file_name}\nVideo title: {video_title}\nVideo length: {video_length}")
+    transcript = cache.get_transcript(file_name, WHISPER_MODEL, backend=WHISPER_BACKEND)
+    if transcript is None:
+        # Downloaded and compact audio files are kept in the runtimes folder within STORAGE_MAX_MB,
+        # example: runtimes/XxCZC5dF8D8.opus. Files are checked before reuse, so partial ones are not used
+        compact_name = compact_audio_name(file_name)
+        download_name = f"{file_name}.mp4"
+        keep_name = None
+        source_path = await job_queue.run_io(storage.get, compact_name)
+        if source_path is None:
+            source_path = await job_queue.run_io(storage.get, download_name)
+            if source_path is None:
+                # download file if wasn't downloaded before
+                tmp_path = storage.temp_path(download_name)
+                try:
+                    await job_queue.run_io(download_audio, youtube_url, download_path=tmp_path)
+                    source_path = await job_queue.run_io(storage.commit, tmp_path, download_name)
+                finally:
+                    storage.discard(tmp_path)
+            keep_name = compact_name
+        # Transcribe chunk by chunk in worker process, which keeps the model warm. Audio is decoded
+        # straight from the download, compact copy is saved for next requests
+        keep_path = storage.temp_path(keep_name) if keep_name else None
+        try:
+            segments = await transcribe_with_progress(message, source_path, video_length, keep_path)
+            if keep_path:
+                await job_queue.run_io(storage.commit, keep_path, keep_name)
+                storage.remove(download_name)
+        finally:
+            if keep_path:
+                storage.discard(keep_path)
+        transcript = "".join(segment["text"] for segment in segments)
+        cache.put_transcript(file_name, WHISPER_MODEL, transcript, backend=WHISPER_BACKEND)
+        # segments are searchable with /search, time windows can be summarized with /window
+        await job_queue.run_io(transcript_index.add_segments, file_name, segments, video_title)
+    return await summarize_transcript(transcript)
+
+
+async def summarize_transcript(transcript: str) -> str:
+    summary = cache.get_summary(transcript, "openai", OPENAI_MODEL)
+    if summary is None:
+        summary = await summarizer.summarize(transcript, OPENAI_MODEL)
+        cache.put_summary(transcript, "openai", OPENAI_MODEL, summary)
+    return summary
+
+
+def upload_info(message: Message) -> Optional[dict]:
+    """
+    File of voice, audio, video or document message, None if the message has no audio or video file
+    """
+    media = message.voice or message.audio or message.video or message.video_note or message.document
+    if media is None:
+        return None
+    mime_type = getattr(media, "mime_type", None) or ""
+    file_name = getattr(media, "file_name", None) or ""
+    extension = os.path.splitext(file_name)[1].lower() or mimetypes.guess_extension(mime_type) or ""
+    # documents can be any files, only audio and video ones are given to ffmpeg
+    if message.document and not mime_type.startswith(("audio/", "video/")) \
+            and extension not in UPLOAD_EXTENSIONS:
+        return None
+    # ".pcm" would be read as raw samples, unknown extensions are left to ffmpeg to detect
+    if not re.fullmatch(r"\.[a-z0-9]{1,5}", extension) or extension == ".pcm":
+        extension = ".bin"
+    upload_id = f"upload_{media.file_unique_id}"
+    return {"id": upload_id, "file_id": media.file_id, "storage_name": f"{upload_id}{extension}",
+            "size": media.file_size or 0, "duration": getattr(media, "duration", None) or 0,
+            "title": file_name or message.content_type}
+
+
+async def process_upload(message: Message, upload: dict) -> str:
+    """
+    Pipeline for file sent to the bot, runs inside job queue worker
+    """
+    transcript = cache.get_transcript(upload["id"], WHISPER_MODEL, backend=WHISPER_BACKEND)
+    if transcript is None:
+        # file is streamed to disk by chunks and kept in the storage, so it isn't downloaded again
+        source_path = await job_queue.run_io(storage.get, upload["storage_name"])
+        if source_path is None:
+            tmp_path = storage.temp_path(upload["storage_name"])
+            try:
+                with span("download", bytes=upload["size"]):
+                    await bot.download(upload["file_id"], destination=tmp_path, timeout=UPLOAD_TIMEOUT)
+                source_path = await job_queue.run_io(storage.commit, tmp_path, upload["storage_name"])
+            finally:
+                storage.discard(tmp_path)
+        duration = upload["duration"] or int(await job_queue.run_io(audio_duration, source_path))
+        # Small files are decoded and transcribed in one pass, big ones chunk by chunk
+        # with progress and bounded memory
+        chunk_seconds = duration + 1 if upload["size"] <= UPLOAD_SINGLE_PASS_MB * 1024 * 1024 else 120
+        segments = await transcribe_with_progress(message, source_path, duration, chunk_seconds=chunk_seconds)
+        transcript = "".join(segment["text"] for segment in segments)
+        cache.put_transcript(upload["id"], WHISPER_MODEL, transcript, backend=WHISPER_BACKEND)
+        await job_queue.run_io(transcript_index.add_segments, upload["id"], segments, upload["title"])
+    return await summarize_transcript(transcript)
+
+
+async def process_video_job(message: Message, source, key: tuple) -> None:
+    """
+    Runs pipeline for YouTube link or uploaded file and shares its result with identical requests
+    which came while it was running
+    """
+    try:
+        with Trace() as trace:
+            if isinstance(source, dict):
+                summary = await process_upload(message, source)
+            else:
+                summary = await process_video(message, source)
+        logging.info(f"Video {key[0]} processed in {trace.total_seconds()}s: {trace.breakdown()}")
+    except Exception as e:
+        coalescer.reject(key, e)
         # But not all the types is supported to be copied so need to handle it
         await message.answer(f"Error happened!\n {e}")
+    else:
+        coalescer.resolve(key, summary)
+        await message.answer(f"Video summary:\n{summary}")
+
+
+async def reply_with_shared_result(message: Message, future: asyncio.Future) -> None:
+    """
+    Waits for the same video processed for another request
+    """
+    try:
+        summary = await future
+    except Exception as e:
+        await message.answer(f"Error happened!\n {e}")
+        return
+    await message.answer(f"Video summary:\n{summary}")
+
+
+@dp.message()
+async def message_handler(message: Message) -> None:
+    """
+    Message handler which puts YouTube video or voice, audio or video file into processing queue
+    """
+    upload = upload_info(message)
+    if upload is not None:
+        if upload["size"] > UPLOAD_MAX_MB * 1024 * 1024:
+            await message.answer(f"File is too big, I can process files up to {UPLOAD_MAX_MB} MB")
+            return
+        source, video_id = upload, upload["id"]
+    elif message.content_type == ContentType.TEXT and is_youtube_url(message.text):
+        source = message.text.strip()
+        video_id = youtube_video_id(source) or source
+    else:
+        await message.answer("You should send me a correct Youtube link or a voice, audio or video file")
+        return
+    # the same video with the same options is processed once for all requests in flight
+    key = (video_id, WHISPER_BACKEND, WHISPER_MODEL, OPENAI_MODEL)
+    future = coalescer.get(key)
+    if future is not None:
+        task = asyncio.create_task(reply_with_shared_result(message, future))
+        # keep reference to the task until it is done
+        waiting_tasks.add(task)
+        task.add_done_callback(waiting_tasks.discard)
+        await message.answer("This video is already being processed, you will get the result soon")
+        return
+    coalescer.lead(key)
+    try:
+        position = job_queue.submit(message.from_user.id, lambda: process_video_job(message, source, key))
+    except (QueueFullError, UserLimitError) as e:
+        coalescer.reject(key, e)
+        await message.answer(str(e))
+        return
+    await message.answer(f"Video added to queue, position: {position}")
 
 
 async def main() -> None:
     """Основная функция для запуска бота и поиска вакансий."""
     try:
+        # files left by crashed runs are removed before the first request
+        storage.cleanup()
+        # transcription processes load whisper models before the first request
+        await job_queue.start()
+        # Prometheus metrics of the pipeline at http://127.0.0.1:METRICS_PORT/metrics
+        if METRICS_PORT:
+            metrics.register_gauge("job_queue_pending", lambda: job_queue.pending)
+            metrics.register_gauge("job_queue_running", lambda: job_queue.running)
+            metrics.register_gauge("openai_requests_in_flight", lambda: summarizer.metrics()["in_flight"])
+            metrics.register_gauge("openai_requests_queued", lambda: summarizer.metrics()["queued"])
+            try:
+                start_metrics_server(METRICS_PORT)
+            except OSError as e:
+                # e.g. port is taken by another instance, the bot works without metrics
+                logging.warning(f"Metrics server isn't started on port {METRICS_PORT}: {e}")
         # the run events dispatching
         await dp.start_polling(bot)
     except Exception as e:
         logging.error(f'Ошибка функции main(): {e}', exc_info=True)
+    finally:
+        await job_queue.stop()
+        await summarizer.aclose()
 
 
 if __name__ == "__main__":
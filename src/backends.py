@@ -0,0 +1,108 @@
+# This file contains transcription engines behind one interface
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+# Approximate memory footprint of fp32 whisper checkpoints (MB), used to make room before loading
+MODEL_SIZES_MB = {
+    "tiny": 150,
+    "base": 300,
+    "small": 1000,
+    "medium": 3000,
+    "turbo": 3200,
+    "large": 6200,
+}
+DEFAULT_MODEL_SIZE_MB = 3000
+
+
+class TranscriptionBackend:
+    """
+    Base class of transcription engine. Engine loads model by name used in app.py
+    ("turbo", "small", "medium", "large") and transcribes 16 kHz mono float32 buffer into
+    {"text": str, "segments": [{"start": float, "end": float, "text": str}, ...]}
+    """
+    name = ""
+
+    def load(self, model_name: str, device: str):
+        raise NotImplementedError
+
+    def transcribe(self, model, audio: np.ndarray, initial_prompt: Optional[str] = None) -> dict:
+        raise NotImplementedError
+
+    def estimate_memory_mb(self, model_name: str) -> int:
+        return MODEL_SIZES_MB.get(model_name, DEFAULT_MODEL_SIZE_MB)
+
+    def memory_mb(self, model, model_name: str) -> int:
+        return self.estimate_memory_mb(model_name)
+
+
+class WhisperBackend(TranscriptionBackend):
+    """
+    openai-whisper on PyTorch (fp32 on CPU, fp16 on GPU).
+    """
+    name = "whisper"
+
+    def load(self, model_name: str, device: str):
+        # imports torch, so it is loaded only when the model is needed
+        import whisper
+        return whisper.load_model(model_name, device=device)
+
+    def transcribe(self, model, audio: np.ndarray, initial_prompt: Optional[str] = None) -> dict:
+        result = model.transcribe(audio, initial_prompt=initial_prompt)
+        return {"text": result["text"],
+                "segments": [{"start": s["start"], "end": s["end"], "text": s["text"]} for s in result["segments"]]}
+
+    def memory_mb(self, model, model_name: str) -> int:
+        total = sum(p.numel() * p.element_size() for p in model.parameters())
+        total += sum(b.numel() * b.element_size() for b in model.buffers())
+        return total // (1024 * 1024)
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """
+    faster-whisper on CTranslate2, int8 quantized weights on CPU. Several times faster than
+    openai-whisper on CPU and uses about a quarter of its memory.
+    Compute type can be changed with FASTER_WHISPER_COMPUTE_TYPE env variable.
+    """
+    name = "faster-whisper"
+    # names of the same checkpoints in faster-whisper
+    MODEL_NAMES = {"turbo": "large-v3-turbo", "large": "large-v3"}
+
+    def load(self, model_name: str, device: str):
+        # optional dependency, it is needed only when this backend is selected
+        from faster_whisper import WhisperModel
+        # CTranslate2 doesn't support mps
+        device = "cuda" if device == "cuda" else "cpu"
+        compute_type = os.getenv("FASTER_WHISPER_COMPUTE_TYPE", "float16" if device == "cuda" else "int8")
+        return WhisperModel(self.MODEL_NAMES.get(model_name, model_name), device=device, compute_type=compute_type,
+                            cpu_threads=int(os.getenv("FASTER_WHISPER_THREADS", "0")))
+
+    def transcribe(self, model, audio: np.ndarray, initial_prompt: Optional[str] = None) -> dict:
+        segments, _ = model.transcribe(audio, initial_prompt=initial_prompt)
+        segments = [{"start": s.start, "end": s.end, "text": s.text} for s in segments]
+        return {"text": "".join(s["text"] for s in segments), "segments": segments}
+
+    def estimate_memory_mb(self, model_name: str) -> int:
+        # int8 weights are 4 times smaller than fp32
+        return MODEL_SIZES_MB.get(model_name, DEFAULT_MODEL_SIZE_MB) // 4
+
+
+BACKENDS: Dict[str, TranscriptionBackend] = {
+    WhisperBackend.name: WhisperBackend(),
+    FasterWhisperBackend.name: FasterWhisperBackend(),
+}
+
+
+def default_backend() -> str:
+    """
+    Backend used when request doesn't choose one, set by TRANSCRIBE_BACKEND env variable.
+    """
+    return os.getenv("TRANSCRIBE_BACKEND", WhisperBackend.name)
+
+
+def get_backend(name: Optional[str] = None) -> TranscriptionBackend:
+    name = name or default_backend()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name}, available: {', '.join(BACKENDS)}")
+    return BACKENDS[name]
@@ -0,0 +1,243 @@
+# This file contains batch mode: many videos are pipelined through shared download, transcription and summary workers
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Iterable, List, Optional, Set
+
+from src.cache import ResultCache
+from src.jobs import JobQueue
+from src.metrics import Trace
+from src.openai_service import SummarizationService
+from src.storage import Storage
+from src.transcript_index import TranscriptIndex
+from src.utils import compact_audio_name, download_audio, is_youtube_url, transcribe_stream, video_info, \
+    youtube_video_id
+
+
+def expand_sources(sources: Iterable[str], proxy: Optional[str] = None) -> List[str]:
+    """
+    Turn video links, playlist and channel links and text files with links (one per line)
+    into list of video links. Repeated videos are kept once.
+
+    Examples
+    --------
+    urls = expand_sources(["https://www.youtube.com/playlist?list=PL...", "links.txt"])
+    """
+    from pytube import Channel, Playlist
+    proxies = {"http": proxy, "https": proxy} if proxy else None
+    urls = []
+    for source in sources:
+        source = source.strip()
+        if not source or source.startswith("#"):
+            continue
+        if os.path.isfile(source):
+            with open(source, encoding="utf-8") as f:
+                urls += expand_sources(f.read().splitlines(), proxy)
+        elif "list=" in source:
+            urls += list(Playlist(source, proxies=proxies).video_urls)
+        elif any(part in source for part in ("/channel/", "/c/", "/user/", "/@")):
+            urls += list(Channel(source, proxies=proxies).video_urls)
+        elif is_youtube_url(source):
+            urls.append(source)
+        else:
+            logging.warning(f"Skipped {source}: not a YouTube link, playlist or file")
+    seen = set()
+    unique = []
+    for url in urls:
+        video_id = youtube_video_id(url) or url
+        if video_id not in seen:
+            seen.add(video_id)
+            unique.append(url)
+    return unique
+
+
+def completed_videos(output_path: str) -> Set[str]:
+    """
+    Video IDs which are already summarized in JSONL output, they are skipped when the run is resumed.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # last line may be cut if the previous run crashed while writing it
+                continue
+            if record.get("status") == "ok":
+                done.add(record["video_id"])
+    return done
+
+
+class BatchRunner:
+    """
+    Runs many videos as a pipeline: while video N is transcribed, next videos are downloaded
+    and previous ones are summarized. Transcription goes to the job queue processes with warm models,
+    summaries to the shared OpenAI service.
+
+    Every finished video is appended to JSONL output right away. Restarted run skips videos which
+    are already in the output, transcripts and downloads of unfinished videos are reused
+    from the cache and the storage.
+
+    Examples
+    --------
+    runner = BatchRunner(job_queue, cache, storage, summarizer, "runtimes/batch.jsonl")
+    await job_queue.start()
+    counts = await runner.run(expand_sources(["https://www.youtube.com/playlist?list=PL..."]))
+    """
+
+    def __init__(self, job_queue: JobQueue, cache: ResultCache, storage: Storage, summarizer: SummarizationService,
+                 output_path: str, model_name: str = "turbo", backend: str = "whisper",
+                 openai_model: str = "gpt-4o", proxy: Optional[str] = None,
+                 download_workers: int = 2, download_ahead: int = 2,
+                 transcript_index: Optional[TranscriptIndex] = None):
+        self.job_queue = job_queue
+        self.cache = cache
+        self.storage = storage
+        self.summarizer = summarizer
+        self.output_path = output_path
+        self.model_name = model_name
+        self.backend = backend
+        self.openai_model = openai_model
+        self.proxy = proxy
+        self.download_workers = download_workers
+        # downloaded videos waiting for transcription, limits disk usage
+        self.download_ahead = download_ahead
+        self.transcript_index = transcript_index
+        self.counts = {"ok": 0, "error": 0, "skipped": 0}
+
+    def _write(self, record: dict) -> None:
+        # one line per video, flushed to disk so crash loses only videos in progress
+        with open(self.output_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.counts[record["status"]] += 1
+
+    def _fail(self, video: dict, e: Exception) -> None:
+        logging.error(f"Video {video['url']} failed: {e}", exc_info=True)
+        self._write({**video, "status": "error", "error": f"{type(e).__name__}: {e}"})
+
+    async def _download_worker(self, urls: asyncio.Queue, to_transcribe: asyncio.Queue,
+                               to_summarize: asyncio.Queue) -> None:
+        while True:
+            url = await urls.get()
+            video = {"url": url, "video_id": youtube_video_id(url) or url, "started": time.time()}
+            try:
+                file_name, title, length = await self.job_queue.run_io(video_info, url, proxy=self.proxy)
+                video.update(video_id=file_name, title=title, length=length)
+                transcript = self.cache.get_transcript(file_name, self.model_name, backend=self.backend)
+                if transcript is not None:
+                    await to_summarize.put((video, transcript))
+                    continue
+                compact_name = compact_audio_name(file_name)
+                download_name = f"{file_name}.mp4"
+                source_path = await self.job_queue.run_io(self.storage.get, compact_name)
+                if source_path is not None:
+                    video.update(source_path=source_path, keep_name=None)
+                else:
+                    source_path = await self.job_queue.run_io(self.storage.get, download_name)
+                    if source_path is None:
+                        tmp_path = self.storage.temp_path(download_name)
+                        try:
+                            await self.job_queue.run_io(download_audio, url, download_path=tmp_path, proxy=self.proxy)
+                            source_path = await self.job_queue.run_io(self.storage.commit, tmp_path, download_name)
+                        finally:
+                            self.storage.discard(tmp_path)
+                    video.update(source_path=source_path, keep_name=compact_name, download_name=download_name)
+                await to_transcribe.put(video)
+            except Exception as e:
+                self._fail(video, e)
+            finally:
+                urls.task_done()
+
+    async def _transcribe_worker(self, to_transcribe: asyncio.Queue, to_summarize: asyncio.Queue) -> None:
+        while True:
+            video = await to_transcribe.get()
+            try:
+                source_path, keep_name = video.pop("source_path"), video.pop("keep_name")
+                download_name = video.pop("download_name", None)
+                keep_path = self.storage.temp_path(keep_name) if keep_name else None
+                segments = []
+                try:
+                    with Trace() as trace:
+                        async for segment in self.job_queue.run_cpu_stream(transcribe_stream, source_path,
+                                                                           model_name=self.model_name,
+                                                                           keep_compact_path=keep_path,
+                                                                           backend=self.backend):
+                            segments.append(segment)
+                    if keep_path:
+                        await self.job_queue.run_io(self.storage.commit, keep_path, keep_name)
+                        self.storage.remove(download_name)
+                finally:
+                    if keep_path:
+                        self.storage.discard(keep_path)
+                transcript = "".join(segment["text"] for segment in segments)
+                self.cache.put_transcript(video["video_id"], self.model_name, transcript, backend=self.backend)
+                if self.transcript_index:
+                    await self.job_queue.run_io(self.transcript_index.add_segments, video["video_id"], segments,
+                                                video.get("title"))
+                video["transcribe_seconds"] = trace.total_seconds()
+                await to_summarize.put((video, transcript))
+            except Exception as e:
+                self._fail(video, e)
+            finally:
+                to_transcribe.task_done()
+
+    async def _summarize_worker(self, to_summarize: asyncio.Queue) -> None:
+        while True:
+            video, transcript = await to_summarize.get()
+            try:
+                summary = self.cache.get_summary(transcript, "openai", self.openai_model)
+                if summary is None:
+                    summary = await self.summarizer.summarize(transcript, self.openai_model)
+                    self.cache.put_summary(transcript, "openai", self.openai_model, summary)
+                started = video.pop("started")
+                self._write({**video, "status": "ok", "model": self.model_name, "backend": self.backend,
+                             "openai_model": self.openai_model, "seconds": round(time.time() - started, 1),
+                             "transcript": transcript, "summary": summary})
+                logging.info(f"Video {video['video_id']} done, {self.counts['ok']} ready")
+            except Exception as e:
+                self._fail(video, e)
+            finally:
+                to_summarize.task_done()
+
+    async def run(self, urls: List[str]) -> dict:
+        """
+        Process all videos and return counts of finished, failed and skipped ones.
+        Job queue should be started before.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+        done = completed_videos(self.output_path)
+        url_queue = asyncio.Queue()
+        for url in urls:
+            if (youtube_video_id(url) or url) in done:
+                self.counts["skipped"] += 1
+            else:
+                url_queue.put_nowait(url)
+        logging.info(f"Batch: {url_queue.qsize()} videos to process, {self.counts['skipped']} already done")
+
+        to_transcribe = asyncio.Queue(maxsize=self.download_ahead)
+        to_summarize = asyncio.Queue()
+        tasks = [asyncio.create_task(self._download_worker(url_queue, to_transcribe, to_summarize))
+                 for _ in range(self.download_workers)]
+        # one transcription at a time per process, so every process keeps one model warm
+        tasks += [asyncio.create_task(self._transcribe_worker(to_transcribe, to_summarize))
+                  for _ in range(self.job_queue.cpu_processes)]
+        # summaries are limited by the service itself
+        tasks += [asyncio.create_task(self._summarize_worker(to_summarize))
+                  for _ in range(self.summarizer.max_concurrency)]
+        try:
+            # every stage puts its item to the next queue before marking it done, so joining
+            # queues in pipeline order waits for all videos
+            await url_queue.join()
+            await to_transcribe.join()
+            await to_summarize.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return self.counts
@@ -0,0 +1,152 @@
+# This file contains persistent cache of transcripts and summaries
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def normalize_range(trim: Optional[Tuple]) -> str:
+    """
+    Make cache key part from clip range, e.g. ("0:30", "12:03") -> "30-723". No range means whole video.
+    """
+    if not trim:
+        return "full"
+    from src.utils import parse_time_to_seconds
+    start, end = (parse_time_to_seconds(t) if isinstance(t, str) and t else t for t in trim)
+    return f"{start or 0}-{end or 'end'}"
+
+
+class ResultCache:
+    """
+    Content-addressed cache: texts are stored as files, SQLite index maps keys to files.
+
+    Transcripts are keyed by (video id, transcription backend and model, clip range),
+    summaries by (transcript hash, summary backend and model, prompt version).
+    Entries older than `ttl_seconds` are dropped, and when total size exceeds `max_bytes`
+    least recently used entries are evicted.
+
+    Examples
+    --------
+    cache = ResultCache("runtimes/cache")
+    text = cache.get_transcript("XxCZC5dF8D8", "turbo")
+    if text is None:
+        text = transcribe("runtimes/XxCZC5dF8D8.mp3", "turbo")
+        cache.put_transcript("XxCZC5dF8D8", "turbo", text)
+    """
+
+    def __init__(self, root: str = "runtimes/cache", ttl_seconds: int = 30 * 24 * 3600,
+                 max_bytes: int = 500 * 1024 * 1024):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.txt")
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if now - row[0] > self.ttl_seconds:
+                self._delete(key)
+                self._db.commit()
+                return None
+            try:
+                with open(self._path(key), encoding="utf-8") as f:
+                    text = f.read()
+            except FileNotFoundError:
+                self._delete(key)
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            return text
+
+    def _put(self, key: str, kind: str, text: str) -> None:
+        data = text.encode("utf-8")
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries (key, kind, size, created, accessed) "
+                             "VALUES (?, ?, ?, ?, ?)", (key, kind, len(data), now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def _delete(self, key: str) -> None:
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now: float) -> None:
+        expired = self._db.execute("SELECT key FROM entries WHERE created < ?",
+                                   (now - self.ttl_seconds,)).fetchall()
+        for (key,) in expired:
+            self._delete(key)
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            self._delete(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    @staticmethod
+    def transcript_key(video_id: str, model_name: str, trim: Optional[Tuple] = None, backend: str = "whisper") -> str:
+        return _hash("transcript", video_id, backend, model_name, normalize_range(trim))
+
+    @staticmethod
+    def summary_key(transcript: str, backend: str, model: str) -> str:
+        from src.utils import PROMPT_VERSION
+        return _hash("summary", _hash(transcript), backend, model, PROMPT_VERSION)
+
+    def get_transcript(self, video_id: str, model_name: str, trim: Optional[Tuple] = None,
+                       backend: str = "whisper") -> Optional[str]:
+        return self._get(self.transcript_key(video_id, model_name, trim, backend))
+
+    def put_transcript(self, video_id: str, model_name: str, text: str, trim: Optional[Tuple] = None,
+                       backend: str = "whisper") -> None:
+        self._put(self.transcript_key(video_id, model_name, trim, backend), "transcript", text)
+
+    def get_summary(self, transcript: str, backend: str, model: str) -> Optional[str]:
+        return self._get(self.summary_key(transcript, backend, model))
+
+    def put_summary(self, transcript: str, backend: str, model: str, summary: str) -> None:
+        self._put(self.summary_key(transcript, backend, model), "summary", summary)
+
+
+def cache_from_env() -> ResultCache:
+    """
+    Create cache configured by .env variables.
+    """
+    return ResultCache(root=os.getenv("CACHE_DIR", "runtimes/cache"),
+                       ttl_seconds=int(os.getenv("CACHE_TTL_DAYS", "30")) * 24 * 3600,
+                       max_bytes=int(os.getenv("CACHE_MAX_MB", "500")) * 1024 * 1024)
@@ -0,0 +1,350 @@
+# This file contains job queue which runs video pipelines without blocking the event loop
+import asyncio
+import contextvars
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from queue import Empty
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from src.metrics import collect_spans, record_span
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class UserLimitError(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    user_id: int
+    run: Callable[[], Awaitable[None]]
+
+
+# spans of model preloading in transcription process, sent to the parent with the first stream
+_preload_spans: List[dict] = []
+
+
+def _init_cpu_worker(preload_models: Iterable[str], backend: Optional[str]) -> None:
+    # runs once in every transcription process, so the models are warm before the first job
+    from src.model_pool import model_pool, preload_models_from_env
+    with collect_spans(_preload_spans.append):
+        model_pool.preload(preload_models, backend=backend)
+        preload_models_from_env(backend=backend)
+
+
+def _warm_up() -> int:
+    # no-op task, makes the pool start its process and run the initializer
+    return os.getpid()
+
+
+def _stream_to_queue(func: Callable, queue, cancel, args: tuple, kwargs: dict) -> None:
+    # runs in transcription process and passes generator items and spans back through manager queue,
+    # metrics of this process are not served
+    while _preload_spans:
+        queue.put(("preload_span", _preload_spans.pop(0)))
+    items = func(*args, **kwargs)
+    try:
+        with collect_spans(lambda record: queue.put(("span", record))):
+            for item in items:
+                # consumer is gone, free the process for the next job
+                if cancel.is_set():
+                    items.close()
+                    return
+                queue.put(("item", item))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+    else:
+        queue.put(("done", None))
+
+
+class JobQueue:
+    """
+    Bounded queue of pipeline jobs served by a fixed number of async workers.
+
+    Blocking calls inside a job go to `run_io` (thread pool: downloads, API requests)
+    or `run_cpu` (process pool: transcription), so the event loop stays responsive.
+
+    Examples
+    --------
+    jobs = JobQueue(workers=2)
+    await jobs.start()
+    position = jobs.submit(user_id, lambda: process_video(message, url))
+    """
+
+    def __init__(self, workers: int = 2, user_limit: int = 2, max_queue: int = 100,
+                 io_threads: int = 8, cpu_processes: int = 1, preload_models: Iterable[str] = (),
+                 preload_backend: Optional[str] = None):
+        self.workers = workers
+        self.user_limit = user_limit
+        self.max_queue = max_queue
+        self.io_threads = io_threads
+        self.cpu_processes = cpu_processes
+        self.preload_models = tuple(preload_models)
+        # transcription engine of preloaded models, by default TRANSCRIBE_BACKEND env variable
+        self.preload_backend = preload_backend
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._user_jobs: Dict[int, int] = defaultdict(int)
+        self._running = 0
+        self._io_pool: Optional[ThreadPoolExecutor] = None
+        self._cpu_pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._io_pool = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="job-io")
+        # spawn instead of fork: forking a process with running event loop and threads is unsafe
+        mp_context = multiprocessing.get_context("spawn")
+        self._manager = mp_context.Manager()
+        self._cpu_pool = ProcessPoolExecutor(max_workers=self.cpu_processes,
+                                             mp_context=mp_context,
+                                             initializer=_init_cpu_worker,
+                                             initargs=(self.preload_models, self.preload_backend))
+        # pool starts processes only for submitted tasks, so every process is started here
+        # and loads the models before the first job instead of inside it
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._cpu_pool, _warm_up) for _ in range(self.cpu_processes)))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        self._cpu_pool.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
+
+    def submit(self, user_id: int, run: Callable[[], Awaitable[None]]) -> int:
+        """
+        Put job into the queue and return its position (1 means it is next to run).
+        """
+        if self._user_jobs[user_id] >= self.user_limit:
+            raise UserLimitError(f"You already have {self._user_jobs[user_id]} videos in progress, "
+                                 f"wait until they are done")
+        try:
+            self._queue.put_nowait(Job(user_id, run))
+        except asyncio.QueueFull:
+            raise QueueFullError("Too many videos in queue, try again later")
+        self._user_jobs[user_id] += 1
+        return self._queue.qsize()
+
+    async def run_io(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        # context is copied, so spans made in the thread get into the trace of the job
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._io_pool, partial(context.run, func, *args, **kwargs))
+
+    async def run_cpu(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._cpu_pool, partial(func, *args, **kwargs))
+
+    async def run_cpu_stream(self, func: Callable, *args, **kwargs) -> AsyncIterator:
+        """
+        Run generator function in transcription process and yield its items as they come.
+        When the stream is closed before the end, the process stops after the current item.
+
+        Examples
+        --------
+        async with aclosing(jobs.run_cpu_stream(transcribe_stream, "audio.opus", "turbo")) as segments:
+            async for segment in segments:
+                print(segment["text"])
+        """
+        queue = self._manager.Queue()
+        cancel = self._manager.Event()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._cpu_pool, partial(_stream_to_queue, func, queue, cancel, args, kwargs))
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, value = await self.run_io(queue.get, timeout=1)
+                except Empty:
+                    if future.done():
+                        # worker process died without sending the end of stream
+                        future.result()
+                        raise RuntimeError("Transcription process stopped unexpectedly")
+                    continue
+                if kind == "error":
+                    finished = True
+                    raise RuntimeError(value)
+                if kind == "done":
+                    finished = True
+                    break
+                if kind == "span":
+                    record_span(value)
+                elif kind == "preload_span":
+                    # model was loaded before the job, so it isn't a part of its trace
+                    record_span(value, to_trace=False)
+                else:
+                    yield value
+        finally:
+            if not finished:
+                cancel.set()
+        await future
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            try:
+                await job.run()
+            except Exception as e:
+                logging.error(f"Job of user {job.user_id} failed: {e}", exc_info=True)
+            finally:
+                self._running -= 1
+                self._user_jobs[job.user_id] -= 1
+                if self._user_jobs[job.user_id] <= 0:
+                    del self._user_jobs[job.user_id]
+                self._queue.task_done()
+
+
+class RequestCoalescer:
+    """
+    Deduplicates identical requests in flight: the first request leads and runs the pipeline,
+    the next ones with the same key wait for its result instead of running it again.
+
+    Examples
+    --------
+    future = coalescer.get(key)
+    if future is None:
+        coalescer.lead(key)
+        ...
+        coalescer.resolve(key, summary)
+    else:
+        summary = await future
+    """
+
+    def __init__(self):
+        self._futures: Dict[Any, asyncio.Future] = {}
+
+    def get(self, key) -> Optional[asyncio.Future]:
+        return self._futures.get(key)
+
+    def lead(self, key) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        return future
+
+    def resolve(self, key, result: Any) -> None:
+        future = self._futures.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def reject(self, key, error: BaseException) -> None:
+        future = self._futures.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # nobody may wait for this request, mark exception as retrieved to avoid warning in log
+            future.exception()
+
+
+class BackgroundTask:
+    """
+    State of pipeline running in background thread. The pipeline reports progress with update(),
+    the page reads snapshot() when it is rerun.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self._lock = threading.Lock()
+        self._state = {"status": "running", "stage": "", "progress": 0.0, "text": "",
+                       "result": None, "error": None, "started": time.time(), "finished": None}
+
+    def update(self, **fields) -> None:
+        with self._lock:
+            self._state.update(fields)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._state)
+
+    @property
+    def done(self) -> bool:
+        return self.snapshot()["status"] != "running"
+
+
+class BackgroundTasks:
+    """
+    Runs long pipelines in background threads, independent of the page which started them.
+    Task with the same key is run once: while it runs or its result is kept, submit returns the same task.
+    Failed tasks are started again.
+
+    Examples
+    --------
+    tasks = BackgroundTasks(max_workers=1)
+    task = tasks.submit(("XxCZC5dF8D8", "turbo"), run_pipeline, url)
+    print(task.snapshot()["progress"])
+    """
+
+    def __init__(self, max_workers: int = 1, keep_seconds: int = 3600):
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="background-task")
+        self._lock = threading.Lock()
+        self._tasks: Dict[Any, BackgroundTask] = {}
+
+    def get(self, key) -> Optional[BackgroundTask]:
+        with self._lock:
+            return self._tasks.get(key)
+
+    def submit(self, key, func: Callable, *args, **kwargs) -> BackgroundTask:
+        """
+        Start func(task, *args, **kwargs) in background, its return value becomes task result.
+        """
+        with self._lock:
+            self._prune()
+            task = self._tasks.get(key)
+            if task is not None and task.snapshot()["status"] != "error":
+                return task
+            task = BackgroundTask(key)
+            self._tasks[key] = task
+        self._pool.submit(self._run, task, func, args, kwargs)
+        return task
+
+    def _run(self, task: BackgroundTask, func: Callable, args: tuple, kwargs: dict) -> None:
+        try:
+            result = func(task, *args, **kwargs)
+        except Exception as e:
+            logging.error(f"Background task {task.key} failed: {e}", exc_info=True)
+            task.update(status="error", error=str(e), finished=time.time())
+        else:
+            task.update(status="done", result=result, progress=1.0, finished=time.time())
+
+    def _prune(self) -> None:
+        # called with self._lock held, finished tasks are kept for a while so the page can show the result
+        now = time.time()
+        for key, task in list(self._tasks.items()):
+            finished = task.snapshot()["finished"]
+            if finished and now - finished > self.keep_seconds:
+                del self._tasks[key]
+
+
+def job_queue_from_env(preload_models: Iterable[str] = (), preload_backend: Optional[str] = None) -> JobQueue:
+    """
+    Create job queue configured by .env variables.
+    """
+    return JobQueue(workers=int(os.getenv("JOBS_WORKERS", "2")),
+                    user_limit=int(os.getenv("JOBS_USER_LIMIT", "2")),
+                    max_queue=int(os.getenv("JOBS_MAX_QUEUE", "100")),
+                    io_threads=int(os.getenv("JOBS_IO_THREADS", "8")),
+                    cpu_processes=int(os.getenv("JOBS_TRANSCRIBE_PROCESSES", "1")),
+                    preload_models=preload_models,
+                    preload_backend=preload_backend)
@@ -1,7 +1,34 @@
 # This file contains code for run local LLM
+from typing import Callable, Optional
+
+from src.local_llm_service import local_llm_service
 from src.utils import summary_prompt
 
 
+def summarize_local(input_text: str, on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Summarize text with resident local model (LOCAL_LLM_MODEL env variable, Qwen2.5 1.5B Instruct by default).
+    The model is loaded once, concurrent calls are batched. on_text receives the answer while it is generated.
+    To use another model replace this function, examples are below.
+
+    Examples
+    --------
+    summary = summarize_local(video_text, on_text=print)
+    """
+    service = local_llm_service()
+    prompt = service.fit(input_text, summary_prompt)
+    if on_text is None:
+        return service.generate(prompt)
+    text = ""
+    for piece in service.stream(prompt):
+        text += piece
+        on_text(text)
+    return text.strip()
+
+
+# Examples with other models, they load the model on every call, so keep it in a global variable for real use
+
+
 # # Example with GPT4All
 #
 # from gpt4all import GPT4All
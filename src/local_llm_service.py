@@ -0,0 +1,250 @@
+# This file contains resident local LLM which summarizes on CPU and batches concurrent requests
+import logging
+import os
+import queue
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Iterator, List, Optional, Set
+
+from src.metrics import span
+
+# Small multilingual instruct model, works on CPU and understands Russian transcripts
+DEFAULT_MODEL = "Qwen/Qwen2.5-1.5B-Instruct"
+
+
+class _Request:
+    def __init__(self, prompt: str):
+        self.prompt = prompt
+        # pieces of the answer for streaming, None marks the end
+        self.pieces: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.streamed = ""
+        self.text = ""
+        self.error: Optional[Exception] = None
+        self.done = threading.Event()
+
+
+class _BatchStreamer:
+    """
+    Receives tokens of all rows of the batch from generate() and passes decoded text of every row
+    to its request. transformers streamers support only batch of one.
+    """
+
+    def __init__(self, tokenizer, requests: List[_Request], stop_ids: Set[int]):
+        self.tokenizer = tokenizer
+        self.requests = requests
+        self.stop_ids = stop_ids
+        self.ids: List[List[int]] = [[] for _ in requests]
+        self.finished = [False] * len(requests)
+        self._prompt = True
+
+    def put(self, value) -> None:
+        # the first call passes the prompt, the next ones pass one new token per row
+        if self._prompt:
+            self._prompt = False
+            return
+        for i, token in enumerate(value.reshape(len(self.requests), -1)[:, -1].tolist()):
+            if self.finished[i]:
+                continue
+            if token in self.stop_ids:
+                self.finished[i] = True
+                continue
+            self.ids[i].append(token)
+            text = self.tokenizer.decode(self.ids[i], skip_special_tokens=True)
+            request = self.requests[i]
+            # incomplete multibyte character is sent with the next token
+            if text.endswith("�") or not text.startswith(request.streamed):
+                continue
+            request.pieces.put(text[len(request.streamed):])
+            request.streamed = text
+
+    def end(self) -> None:
+        pass
+
+
+class LocalLLMService:
+    """
+    One local model loaded once per process and served by a background thread. Requests which come
+    while the model is busy are generated together in one batch (up to `max_batch`), the answer
+    can be streamed piece by piece.
+
+    Memory is limited by quantization ('int8' - dynamic int8 quantization of linear layers for CPU,
+    'bf16' or 'none' for fp32), prompt length (`context_tokens`) and batch size.
+
+    Examples
+    --------
+    service = LocalLLMService("Qwen/Qwen2.5-1.5B-Instruct", quantization="int8", max_batch=4)
+    summary = service.generate(service.fit(transcript, summary_prompt))
+    for piece in service.stream(service.fit(transcript, summary_prompt)):
+        print(piece, end="")
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, quantization: str = "int8", max_batch: int = 4,
+                 context_tokens: int = 4096, max_new_tokens: int = 1024, batch_wait: float = 0.05,
+                 threads: int = 0, temperature: float = 0.6):
+        self.model_name = model_name
+        self.quantization = quantization
+        self.max_batch = max_batch
+        self.context_tokens = context_tokens
+        self.max_new_tokens = max_new_tokens
+        # how long the first request waits for others to join its batch
+        self.batch_wait = batch_wait
+        self.threads = threads
+        self.temperature = temperature
+        self.tokenizer = None
+        self.model = None
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def load(self) -> None:
+        """
+        Load model now instead of on the first request.
+        """
+        with self._lock:
+            if self.model is not None:
+                return
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+            if self.threads:
+                torch.set_num_threads(self.threads)
+            with span("model_load", backend="local_llm", model=self.model_name):
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name, token=os.getenv("huggingface_token"))
+                # batch is padded on the left, so new tokens of all rows are generated at the same positions
+                tokenizer.padding_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                dtype = torch.bfloat16 if self.quantization == "bf16" else torch.float32
+                model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=dtype,
+                                                             low_cpu_mem_usage=True,
+                                                             token=os.getenv("huggingface_token"))
+                if self.quantization == "int8":
+                    # weights of linear layers are stored in int8, activations are quantized on the fly
+                    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+                model.eval()
+            self.tokenizer, self.model = tokenizer, model
+            logging.info(f"Local LLM {self.model_name} loaded ({self.quantization})")
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Number of tokens of text for this model, without chat template.
+        """
+        self.load()
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def text_budget(self, prompt_fn: Callable[[str], str]) -> int:
+        """
+        How many tokens of text fit into prompt made by prompt_fn, with chat template and the answer.
+        """
+        self.load()
+        return self.context_tokens - self.max_new_tokens - self.count_tokens(self._format(prompt_fn("")))
+
+    def fit(self, text: str, prompt_fn: Callable[[str], str]) -> str:
+        """
+        Prompt made by prompt_fn from text, the end of the text is cut if the prompt doesn't fit into context.
+        Text is cut before it goes into the prompt, so instructions and chat template are always kept.
+
+        Examples
+        --------
+        summary = service.generate(service.fit(transcript, summary_prompt))
+        """
+        budget = max(0, self.text_budget(prompt_fn))
+        ids = self.tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) > budget:
+            logging.warning(f"Local LLM: text of {len(ids)} tokens is cut to {budget} tokens")
+            text = self.tokenizer.decode(ids[:budget], skip_special_tokens=True)
+        return prompt_fn(text)
+
+    def _submit(self, prompt: str) -> _Request:
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, name="local-llm", daemon=True)
+                self._worker.start()
+        request = _Request(prompt)
+        self._queue.put(request)
+        return request
+
+    def generate(self, prompt: str) -> str:
+        request = self._submit(prompt)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yield pieces of the answer as they are generated.
+        """
+        request = self._submit(prompt)
+        while True:
+            piece = request.pieces.get()
+            if piece is None:
+                break
+            yield piece
+        if request.error:
+            raise request.error
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self.load()
+                self._generate(batch)
+            except Exception as e:
+                logging.error(f"Local LLM failed: {e}", exc_info=True)
+                for request in batch:
+                    request.error = e
+            finally:
+                for request in batch:
+                    request.pieces.put(None)
+                    request.done.set()
+
+    def _format(self, prompt: str) -> str:
+        if getattr(self.tokenizer, "chat_template", None):
+            return self.tokenizer.apply_chat_template([{"role": "user", "content": prompt}], tokenize=False,
+                                                      add_generation_prompt=True)
+        return prompt
+
+    def _generate(self, batch: List[_Request]) -> None:
+        import torch
+        # prompts are not truncated here: cut chat template would make the model continue the text,
+        # callers fit the text into context with fit()
+        inputs = self.tokenizer([self._format(request.prompt) for request in batch], return_tensors="pt",
+                                padding=True)
+        # chat models may have several end of answer tokens
+        eos = self.model.generation_config.eos_token_id
+        stop_ids = set(eos if isinstance(eos, list) else [eos]) | {self.tokenizer.eos_token_id,
+                                                                   self.tokenizer.pad_token_id}
+        streamer = _BatchStreamer(self.tokenizer, batch, stop_ids)
+        with span("local_llm_generate", model=self.model_name, batch=len(batch),
+                  tokens=int(inputs["attention_mask"].sum())):
+            with torch.inference_mode():
+                outputs = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens, do_sample=True,
+                                              temperature=self.temperature, top_p=0.9, streamer=streamer,
+                                              pad_token_id=self.tokenizer.pad_token_id)
+        prompt_length = inputs["input_ids"].shape[1]
+        for request, row in zip(batch, outputs):
+            text = self.tokenizer.decode(row[prompt_length:], skip_special_tokens=True)
+            # rest of the answer which streamer kept back
+            if text.startswith(request.streamed) and len(text) > len(request.streamed):
+                request.pieces.put(text[len(request.streamed):])
+            request.text = text.strip()
+
+
+@lru_cache(maxsize=1)
+def local_llm_service() -> LocalLLMService:
+    """
+    Service shared by the process, configured by .env variables.
+    """
+    return LocalLLMService(model_name=os.getenv("LOCAL_LLM_MODEL", DEFAULT_MODEL),
+                           quantization=os.getenv("LOCAL_LLM_QUANTIZATION", "int8").lower(),
+                           max_batch=int(os.getenv("LOCAL_LLM_MAX_BATCH", "4")),
+                           context_tokens=int(os.getenv("LOCAL_LLM_CONTEXT", "4096")),
+                           max_new_tokens=int(os.getenv("LOCAL_LLM_MAX_NEW_TOKENS", "1024")),
+                           threads=int(os.getenv("LOCAL_LLM_THREADS", "0")))
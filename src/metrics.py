@@ -0,0 +1,236 @@
+# This file contains pipeline instrumentation: per-stage spans, counters, gauges and Prometheus endpoint
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Span attributes which are summed into counters
+COUNTED_ATTRIBUTES = ("bytes", "audio_seconds", "tokens")
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels_key(labels: Dict[str, str]) -> LabelsKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key: LabelsKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters, gauges and summaries, rendered in Prometheus text format.
+
+    Examples
+    --------
+    metrics.inc("pipeline_bytes_total", 1024, stage="download")
+    metrics.set_gauge("pipeline_real_time_factor", 0.3, stage="transcribe")
+    metrics.register_gauge("job_queue_pending", lambda: job_queue.pending)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelsKey, List[float]]] = {}
+        self._callbacks: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _labels_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            count_sum = self._summaries.setdefault(name, {}).setdefault(_labels_key(labels), [0, 0.0])
+            count_sum[0] += 1
+            count_sum[1] += value
+
+    def register_gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """
+        Gauge which value is read from callback when metrics are rendered, e.g. queue depth.
+        """
+        with self._lock:
+            self._callbacks[name] = callback
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{_format_labels(key)} {value}" for key, value in series.items()]
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines += [f"{name}{_format_labels(key)} {value}" for key, value in series.items()]
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for key, (count, total) in series.items():
+                    lines.append(f"{name}_count{_format_labels(key)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {total}")
+            callbacks = sorted(self._callbacks.items())
+        for name, callback in callbacks:
+            try:
+                value = callback()
+            except Exception as e:
+                logging.error(f"Gauge {name} failed: {e}")
+                continue
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """
+    Spans of one pipeline run, used to show timing breakdown to user.
+
+    Examples
+    --------
+    with Trace() as trace:
+        run_pipeline()
+    print(trace.breakdown())
+    """
+
+    def __init__(self):
+        self.spans: List[dict] = []
+        self._token = None
+
+    def __enter__(self) -> "Trace":
+        self._token = _current_trace.set(self)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        _current_trace.reset(self._token)
+
+    def breakdown(self) -> List[dict]:
+        """
+        Spans summed by stage in order of the first appearance, e.g. all transcribed chunks give one row.
+        """
+        stages: Dict[str, dict] = {}
+        for record in self.spans:
+            row = stages.setdefault(record["stage"], {"stage": record["stage"], "calls": 0, "seconds": 0.0})
+            row["calls"] += 1
+            row["seconds"] = round(row["seconds"] + record["seconds"], 3)
+            for key in COUNTED_ATTRIBUTES:
+                if record.get(key):
+                    row[key] = round(row.get(key, 0) + record[key], 3)
+        for row in stages.values():
+            if row.get("audio_seconds"):
+                row["rtf"] = round(row["seconds"] / row["audio_seconds"], 3)
+        return list(stages.values())
+
+    def total_seconds(self) -> float:
+        return round(sum(span["seconds"] for span in self.spans), 3)
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_span_collector: ContextVar[Optional[Callable[[dict], None]]] = ContextVar("span_collector", default=None)
+
+
+def record_span(record: dict, to_trace: bool = True) -> None:
+    """
+    Put finished span into metrics, log and current Trace, e.g. span received from worker process.
+    """
+    stage, seconds = record["stage"], record["seconds"]
+    if record.get("error"):
+        metrics.inc("pipeline_stage_errors_total", stage=stage)
+    metrics.observe("pipeline_stage_seconds", seconds, stage=stage)
+    for key in COUNTED_ATTRIBUTES:
+        if record.get(key):
+            metrics.inc(f"pipeline_{key}_total", record[key], stage=stage)
+    if record.get("rtf") is not None:
+        metrics.set_gauge("pipeline_real_time_factor", record["rtf"], stage=stage)
+    logging.info(f"span {json.dumps(record, ensure_ascii=False, default=str)}")
+    trace = _current_trace.get()
+    if to_trace and trace is not None:
+        trace.spans.append(record)
+
+
+@contextmanager
+def collect_spans(callback: Callable[[dict], None]) -> Iterator[None]:
+    """
+    Pass spans finished inside the block to callback instead of recording them. Worker processes
+    have their own metrics, so they send spans to the parent which records them with record_span.
+
+    Examples
+    --------
+    with collect_spans(lambda record: queue.put(("span", record))):
+        segments = list(transcribe_stream(path, "turbo"))
+    """
+    token = _span_collector.set(callback)
+    try:
+        yield
+    finally:
+        _span_collector.reset(token)
+
+
+@contextmanager
+def span(stage: str, **attributes) -> Iterator[dict]:
+    """
+    Measure pipeline stage. Yielded dict can be filled with bytes, audio_seconds or tokens inside the block.
+    Duration and attributes go to metrics, to the log and to the current Trace.
+
+    Examples
+    --------
+    with span("download") as attrs:
+        download_audio(url, path)
+        attrs["bytes"] = os.path.getsize(path)
+    """
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield attributes
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        record = {"stage": stage, "seconds": round(seconds, 3), **attributes}
+        if failed:
+            record["error"] = True
+        if attributes.get("audio_seconds"):
+            record["rtf"] = round(seconds / attributes["audio_seconds"], 3)
+        collector = _span_collector.get()
+        if collector is not None:
+            collector(record)
+        else:
+            record_span(record)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve metrics at http://host:port/metrics in background thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+metrics = Metrics()
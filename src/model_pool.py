@@ -0,0 +1,150 @@
+# This file contains process-wide registry of loaded transcription models
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from src.backends import default_backend, get_backend
+from src.metrics import span
+
+# (backend, model name, device)
+ModelKey = Tuple[str, str, str]
+
+
+@lru_cache(maxsize=None)
+def get_device() -> str:
+    """
+    Pick the best available torch device for transcription. Detected once per process.
+    """
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def _empty_cuda_cache() -> None:
+    # torch is imported only if some model was loaded with it
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelPool:
+    """
+    Keeps loaded transcription models warm between requests.
+
+    Every (backend, model name, device) is loaded once. When the sum of loaded models exceeds
+    `max_memory_mb`, least recently used models are evicted. The model which was requested
+    last is never evicted, so a single model bigger than the budget still works.
+
+    Examples
+    --------
+    pool = ModelPool(max_memory_mb=8000)
+    with pool.use("turbo", backend="faster-whisper") as model:
+        text = get_backend("faster-whisper").transcribe(model, audio)["text"]
+    """
+
+    def __init__(self, max_memory_mb: int = 8000):
+        self.max_memory_mb = max_memory_mb
+        self._models: "OrderedDict[ModelKey, object]" = OrderedDict()
+        self._sizes: Dict[ModelKey, int] = {}
+        # guards the registry itself
+        self._lock = threading.Lock()
+        # one lock per model: serializes loading and inference (whisper decoding installs hooks
+        # on the model, so the same instance can't transcribe two files at once)
+        self._model_locks: Dict[ModelKey, threading.Lock] = {}
+
+    def _key(self, model_name: str, device: Optional[str], backend: Optional[str]) -> ModelKey:
+        return backend or default_backend(), model_name, device or get_device()
+
+    def _model_lock(self, key: ModelKey) -> threading.Lock:
+        with self._lock:
+            return self._model_locks.setdefault(key, threading.Lock())
+
+    def _used_memory_mb(self) -> int:
+        return sum(self._sizes.values())
+
+    def _make_room(self, needed_mb: int, keep: ModelKey) -> None:
+        # called with self._lock held
+        while self._models and self._used_memory_mb() + needed_mb > self.max_memory_mb:
+            oldest = next(iter(self._models))
+            if oldest == keep:
+                break
+            self._models.pop(oldest)
+            self._sizes.pop(oldest, None)
+            logging.info(f"Model {oldest[1]} ({oldest[0]}, {oldest[2]}) evicted from pool")
+        _empty_cuda_cache()
+
+    def _get(self, key: ModelKey):
+        backend_name, model_name, device = key
+        backend = get_backend(backend_name)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                return model
+            self._make_room(backend.estimate_memory_mb(model_name), keep=key)
+
+        logging.info(f"Loading model {model_name} ({backend_name}) on device {device}")
+        with span("model_load", backend=backend_name, model=model_name, device=device):
+            model = backend.load(model_name, device)
+
+        with self._lock:
+            self._models[key] = model
+            self._sizes[key] = backend.memory_mb(model, model_name)
+            self._make_room(0, keep=key)
+        return model
+
+    def get(self, model_name: str, device: Optional[str] = None, backend: Optional[str] = None):
+        """
+        Return loaded model, loading it on first use.
+        """
+        key = self._key(model_name, device, backend)
+        with self._model_lock(key):
+            return self._get(key)
+
+    @contextmanager
+    def use(self, model_name: str, device: Optional[str] = None, backend: Optional[str] = None) -> Iterator:
+        """
+        Hold exclusive access to the model for the duration of the block.
+        """
+        key = self._key(model_name, device, backend)
+        with self._model_lock(key):
+            yield self._get(key)
+
+    def preload(self, model_names: Iterable[str], device: Optional[str] = None, backend: Optional[str] = None) -> None:
+        """
+        Load models ahead of the first request.
+        """
+        for model_name in model_names:
+            self.get(model_name, device, backend)
+
+    def loaded(self) -> Dict[ModelKey, int]:
+        """
+        Loaded models with their memory usage in MB, from least to most recently used.
+        """
+        with self._lock:
+            return {key: self._sizes.get(key, 0) for key in self._models}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+            self._sizes.clear()
+        _empty_cuda_cache()
+
+
+def preload_models_from_env(device: Optional[str] = None, backend: Optional[str] = None) -> None:
+    """
+    Preload models listed in WHISPER_PRELOAD env variable, e.g. WHISPER_PRELOAD = 'turbo,small'
+    """
+    names = [name.strip() for name in os.getenv("WHISPER_PRELOAD", "").split(",") if name.strip()]
+    model_pool.preload(names, device, backend)
+
+
+model_pool = ModelPool(max_memory_mb=int(os.getenv("WHISPER_POOL_MAX_MB", "8000")))
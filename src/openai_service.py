@@ -0,0 +1,160 @@
+# This file contains shared async OpenAI summarization service
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Dict, Optional
+
+import httpx
+from openai import APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
+
+from src.metrics import span
+from src.summarize import ANSWER_TOKENS, CONTEXT_TOKENS, DEFAULT_CONTEXT_TOKENS, count_tokens, \
+    summarize_map_reduce_async
+from src.utils import summary_prompt
+
+
+class TokenBucket:
+    """
+    Rate limiter which allows `rate_per_minute` units per minute with bursts up to the same amount.
+
+    Examples
+    --------
+    requests = TokenBucket(500)
+    await requests.acquire()
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self.rate = rate_per_minute / 60
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: int = 1) -> None:
+        # request bigger than the bucket waits for the full bucket instead of forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class SummarizationService:
+    """
+    Async OpenAI client shared by all requests: keeps pooled HTTP connections, retries 429 and 5xx
+    responses with exponential backoff, and limits requests and tokens per minute.
+
+    Set base_url to use OpenAI-compatible server, e.g. local stub server for tests.
+
+    Examples
+    --------
+    service = SummarizationService(api_key, requests_per_minute=500, tokens_per_minute=30000)
+    summary = await service.summarize(transcript, "gpt-4o")
+    print(service.metrics())
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 requests_per_minute: int = 500, tokens_per_minute: int = 30000, max_concurrency: int = 8,
+                 max_retries: int = 5, timeout: float = 120):
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self._http = httpx.AsyncClient(timeout=timeout,
+                                       limits=httpx.Limits(max_connections=max_concurrency,
+                                                           max_keepalive_connections=max_concurrency))
+        # retries are done here, so the client itself doesn't retry
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=0)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._in_flight = 0
+        self._queued = 0
+        self._counters = {"requests_total": 0, "retries_total": 0, "errors_total": 0, "tokens_total": 0}
+
+    def metrics(self) -> Dict[str, int]:
+        return {"in_flight": self._in_flight, "queued": self._queued, **self._counters}
+
+    async def _create(self, prompt: str, model: str, temperature: float) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with span("summarize", backend="openai", model=model) as attrs:
+                    response = await self._client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}],
+                        temperature=temperature,
+                    )
+                    if response.usage:
+                        attrs["tokens"] = response.usage.total_tokens
+                        self._counters["tokens_total"] += response.usage.total_tokens
+                return response.choices[0].message.content
+            except (APIConnectionError, APITimeoutError, APIStatusError) as e:
+                status = getattr(e, "status_code", None)
+                retryable = status is None or status == 429 or status >= 500
+                if not retryable or attempt == self.max_retries:
+                    self._counters["errors_total"] += 1
+                    raise
+                delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                retry_after = e.response.headers.get("retry-after") if getattr(e, "response", None) else None
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                self._counters["retries_total"] += 1
+                logging.warning(f"OpenAI request failed ({status or e}), retry in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def complete(self, prompt: str, model: str = "gpt-3.5-turbo", temperature: float = 0.6) -> str:
+        """
+        Send one chat completion request, waiting for free slot and rate limits.
+        """
+        self._queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+        try:
+            await self._requests.acquire(1)
+            await self._tokens.acquire(count_tokens(prompt, model) + ANSWER_TOKENS)
+            self._in_flight += 1
+            self._counters["requests_total"] += 1
+            try:
+                return await self._create(prompt, model, temperature)
+            finally:
+                self._in_flight -= 1
+        finally:
+            self._semaphore.release()
+
+    async def summarize(self, input_text: str, model: str = "gpt-3.5-turbo") -> str:
+        """
+        Summarize text of any length, long texts are summarized by sections concurrently.
+        """
+        async def summarize_single(text: str) -> str:
+            return await self.complete(summary_prompt(text), model)
+
+        return await summarize_map_reduce_async(input_text, summarize_single,
+                                                CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS), model,
+                                                chunk_tokens=int(os.getenv("SUMMARY_CHUNK_TOKENS", "8000")))
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+
+def summarization_service_from_env(api_key: Optional[str] = None) -> SummarizationService:
+    """
+    Create service configured by .env variables.
+    """
+    return SummarizationService(api_key=api_key,
+                                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                                requests_per_minute=int(os.getenv("OPENAI_RPM", "500")),
+                                tokens_per_minute=int(os.getenv("OPENAI_TPM", "30000")),
+                                max_concurrency=int(os.getenv("SUMMARY_MAX_PARALLEL", "4")))
@@ -0,0 +1,198 @@
+# This file contains disk-bounded storage of audio files in the runtimes folder
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+# Temporary files of unfinished writes: "part-<pid>-<thread>-<name>" made by Storage,
+# "<name>.part" and "<name>.<pid>.<thread>.part" made by downloads and compact audio writer
+TEMP_PREFIX = "part-"
+TEMP_SUFFIX = ".part"
+# Files which are left in runtimes folder by earlier versions or crashed runs and can be removed
+ARTIFACT_EXTENSIONS = (".mp4", ".m4a", ".webm", ".mp3", ".opus", ".pcm", ".wav")
+
+
+def file_checksum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Storage:
+    """
+    Audio files (downloads and compact copies) in the runtimes folder, limited by `max_bytes`.
+
+    Files are written to temporary names and appear under their own name only when complete,
+    with size and checksum saved in SQLite index. Before reuse a file is checked against the index,
+    so partial or damaged files are removed instead of being transcribed. When total size exceeds
+    the budget, least recently used files are evicted, except files used during the last
+    `grace_seconds` which may be read by running jobs.
+
+    Examples
+    --------
+    storage = Storage("runtimes", max_bytes=5 * 1024 ** 3)
+    path = storage.get("XxCZC5dF8D8.mp4")
+    if path is None:
+        with storage.write("XxCZC5dF8D8.mp4") as tmp_path:
+            download_audio(url, tmp_path)
+        path = storage.get("XxCZC5dF8D8.mp4")
+    """
+
+    def __init__(self, root: str = "runtimes", max_bytes: int = 5 * 1024 ** 3, grace_seconds: int = 6 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.grace_seconds = grace_seconds
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "storage.sqlite"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                checksum TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)")
+        self._db.commit()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def get(self, name: Optional[str]) -> Optional[str]:
+        """
+        Path of complete and valid file, or None if there is no such file.
+        """
+        if not name:
+            return None
+        path = self.path(name)
+        with self._lock:
+            row = self._db.execute("SELECT size, checksum FROM files WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                return None
+            # file is marked as used first, so it isn't evicted while it is checked
+            self._db.execute("UPDATE files SET accessed = ? WHERE name = ?", (time.time(), name))
+            self._db.commit()
+        # big files are hashed without the lock, other threads keep using the storage meanwhile
+        try:
+            valid = os.path.getsize(path) == row[0] and file_checksum(path) == row[1]
+        except FileNotFoundError:
+            valid = False
+        if valid:
+            return path
+        with self._lock:
+            # the file could be replaced by a new commit while it was checked
+            current = self._db.execute("SELECT size, checksum FROM files WHERE name = ?", (name,)).fetchone()
+            if current is not None and tuple(current) == tuple(row):
+                logging.warning(f"Storage: {name} is missing or damaged, removed")
+                self._delete(name)
+                self._db.commit()
+        return None
+
+    def temp_path(self, name: str) -> str:
+        """
+        Unique temporary path for writing file, extension is kept so tools can detect format.
+        """
+        return self.path(f"{TEMP_PREFIX}{os.getpid()}-{threading.get_ident()}-{name}")
+
+    def commit(self, tmp_path: str, name: str) -> str:
+        """
+        Move complete file from temporary path to its name and add it to the index.
+        """
+        size = os.path.getsize(tmp_path)
+        checksum = file_checksum(tmp_path)
+        path = self.path(name)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO files (name, size, checksum, created, accessed) "
+                             "VALUES (?, ?, ?, ?, ?)", (name, size, checksum, now, now))
+            self._evict(now)
+            self._db.commit()
+        return path
+
+    @staticmethod
+    def discard(tmp_path: str) -> None:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    @contextmanager
+    def write(self, name: str) -> Iterator[str]:
+        """
+        Yield temporary path to write into. File is committed when the block succeeds
+        and removed when it fails.
+        """
+        tmp_path = self.temp_path(name)
+        try:
+            yield tmp_path
+            self.commit(tmp_path, name)
+        finally:
+            self.discard(tmp_path)
+
+    def remove(self, name: Optional[str]) -> None:
+        if not name:
+            return
+        with self._lock:
+            self._delete(name)
+            self._db.commit()
+
+    def _delete(self, name: str) -> None:
+        self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, now: float) -> None:
+        # called with self._lock held
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT name, size FROM files WHERE accessed < ? ORDER BY accessed",
+                                (now - self.grace_seconds,)).fetchall()
+        for name, size in rows:
+            self._delete(name)
+            total -= size
+            logging.info(f"Storage: {name} evicted")
+            if total <= self.max_bytes:
+                return
+        logging.warning(f"Storage: {total // 1024 ** 2} MB in use is over the budget, all files are in use")
+
+    def cleanup(self, temp_age_seconds: int = 3600) -> None:
+        """
+        Remove what crashed runs left: temporary files, files which are not in the index
+        and index rows without files. Run it on startup.
+        """
+        now = time.time()
+        with self._lock:
+            known = {name for (name,) in self._db.execute("SELECT name FROM files")}
+            for name in known:
+                if not os.path.exists(self.path(name)):
+                    self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+            for entry in os.scandir(self.root):
+                if not entry.is_file() or entry.name in known:
+                    continue
+                # temporary files may belong to another running process, so only old ones are removed
+                age = now - entry.stat().st_mtime
+                is_temp = entry.name.startswith(TEMP_PREFIX) or entry.name.endswith(TEMP_SUFFIX)
+                if (is_temp and age > temp_age_seconds) or (entry.name.endswith(ARTIFACT_EXTENSIONS) and age > 60):
+                    logging.info(f"Storage: orphan file {entry.name} removed")
+                    os.remove(entry.path)
+            self._evict(now)
+            self._db.commit()
+
+
+def storage_from_env() -> Storage:
+    """
+    Create storage configured by .env variables.
+    """
+    return Storage(root=os.getenv("STORAGE_DIR", "runtimes"),
+                   max_bytes=int(os.getenv("STORAGE_MAX_MB", "5000")) * 1024 * 1024,
+                   grace_seconds=int(os.getenv("STORAGE_GRACE_MINUTES", "360")) * 60)
@@ -0,0 +1,169 @@
+# This file contains map-reduce summarization for transcripts which don't fit into LLM context
+import asyncio
+import contextvars
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Awaitable, Callable, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from src.metrics import span
+from src.utils import summarize_openai_text, summary_prompt
+
+# Context window of OpenAI models in tokens
+CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = 16385
+# Tokens reserved for the answer of the model
+ANSWER_TOKENS = 1024
+
+
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """
+    Count tokens with tokenizer of the model, without tiktoken it is estimated as 4 characters per token.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+
+def split_by_tokens(text: str, max_tokens: int, model: str = "gpt-4o",
+                    count_fn: Optional[Callable[[str], int]] = None) -> List[str]:
+    """
+    Split text into sections of at most max_tokens, cutting between sentences where possible.
+    Tokens are counted by count_fn if it is set, e.g. with tokenizer of local model.
+
+    Examples
+    --------
+    sections = split_by_tokens(transcript, 8000)
+    """
+    count = count_fn or partial(count_tokens, model=model)
+    sections = []
+    current = []
+    current_tokens = 0
+    for sentence in re.split(r"(?<=[.!?…])\s+", text.strip()):
+        tokens = count(sentence)
+        if tokens > max_tokens:
+            # sentence without punctuation (whisper makes them sometimes) is cut by length
+            pieces = [sentence[i:i + max_tokens * 3] for i in range(0, len(sentence), max_tokens * 3)]
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            tokens = count(piece)
+            if current and current_tokens + tokens > max_tokens:
+                sections.append(" ".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        sections.append(" ".join(current))
+    return sections
+
+
+def summarize_map_reduce(text: str, summarize_fn: Callable[[str], str], context_tokens: int,
+                         model: str = "gpt-4o", chunk_tokens: Optional[int] = None, max_workers: int = 4,
+                         final_fn: Optional[Callable[[str], str]] = None,
+                         count_fn: Optional[Callable[[str], int]] = None,
+                         max_text_tokens: Optional[int] = None) -> str:
+    """
+    Summarize text in one request if it fits into context of the model. Otherwise summarize sections
+    of the text concurrently (at most max_workers requests at once) and then summarize partial summaries.
+    final_fn is used instead of summarize_fn for the request which gives the result, e.g. streaming one.
+    count_fn counts tokens instead of tiktoken and max_text_tokens sets how much text fits into one request,
+    by default it is computed from context_tokens.
+
+    Examples
+    --------
+    summary = summarize_map_reduce(transcript, local_llm.summarize_local, context_tokens=4096)
+    """
+    count = count_fn or partial(count_tokens, model=model)
+    budget = max_text_tokens or context_tokens - count(summary_prompt("")) - ANSWER_TOKENS
+    if count(text) <= budget:
+        return (final_fn or summarize_fn)(text)
+    sections = split_by_tokens(text, min(budget, chunk_tokens or budget), model, count_fn)
+    logging.info(f"Text is too long, summarizing {len(sections)} sections")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # every section runs in a copy of the context, so its spans get into the current Trace
+        futures = [pool.submit(contextvars.copy_context().run, summarize_fn, section) for section in sections]
+        partial_summaries = [future.result() for future in futures]
+    # partial summaries are summarized the same way, in sections again if they are still too long
+    return summarize_map_reduce("\n\n".join(partial_summaries), summarize_fn, context_tokens, model,
+                                chunk_tokens, max_workers, final_fn, count_fn, max_text_tokens)
+
+
+async def summarize_map_reduce_async(text: str, summarize_fn: Callable[[str], Awaitable[str]], context_tokens: int,
+                                     model: str = "gpt-4o", chunk_tokens: Optional[int] = None) -> str:
+    """
+    Async version of summarize_map_reduce, parallelism is limited by summarize_fn itself.
+
+    Examples
+    --------
+    async def summarize_single(text):
+        return await service.complete(summary_prompt(text), "gpt-4o")
+
+    summary = await summarize_map_reduce_async(transcript, summarize_single, context_tokens=128000)
+    """
+    budget = context_tokens - count_tokens(summary_prompt(""), model) - ANSWER_TOKENS
+    if count_tokens(text, model) <= budget:
+        return await summarize_fn(text)
+    sections = split_by_tokens(text, min(budget, chunk_tokens or budget), model)
+    logging.info(f"Text is too long, summarizing {len(sections)} sections")
+    partial_summaries = await asyncio.gather(*(summarize_fn(section) for section in sections))
+    return await summarize_map_reduce_async("\n\n".join(partial_summaries), summarize_fn, context_tokens, model,
+                                            chunk_tokens)
+
+
+def summarize_openai_long(input_text: str, model: str = "gpt-3.5-turbo", api_key: str = None) -> str:
+    """
+    Summarize text of any length with OpenAI API. Section size and number of parallel requests
+    are set by SUMMARY_CHUNK_TOKENS and SUMMARY_MAX_PARALLEL env variables.
+    """
+    return summarize_map_reduce(input_text, partial(summarize_openai_text, model=model, api_key=api_key),
+                                CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS), model,
+                                chunk_tokens=int(os.getenv("SUMMARY_CHUNK_TOKENS", "8000")),
+                                max_workers=int(os.getenv("SUMMARY_MAX_PARALLEL", "4")))
+
+
+def summarize_local_long(input_text: str, on_text: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Summarize text of any length with local LLM. Context size and number of parallel requests
+    are set by LOCAL_LLM_CONTEXT and LOCAL_LLM_MAX_PARALLEL env variables, parallel requests
+    are generated in one batch. on_text receives the final summary while it is generated.
+    Sections are measured with tokenizer of the local model, with its chat template and answer length.
+    """
+    import src.local_llm as local_llm
+    from src.local_llm_service import local_llm_service
+    service = local_llm_service()
+
+    def summarize_single(text: str) -> str:
+        with span("summarize", backend="local", tokens=service.count_tokens(text)):
+            return local_llm.summarize_local(text)
+
+    def summarize_final(text: str) -> str:
+        with span("summarize", backend="local", tokens=service.count_tokens(text)):
+            return local_llm.summarize_local(text, on_text=on_text)
+
+    return summarize_map_reduce(input_text, summarize_single, service.context_tokens,
+                                max_workers=int(os.getenv("LOCAL_LLM_MAX_PARALLEL", "4")),
+                                final_fn=summarize_final if on_text else None,
+                                count_fn=service.count_tokens,
+                                max_text_tokens=service.text_budget(summary_prompt))
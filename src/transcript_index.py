@@ -0,0 +1,168 @@
+# This file contains full-text index of timestamped transcript segments of all processed videos
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+
+def fts_phrase(query: str) -> str:
+    """
+    Make FTS5 phrase query from user text, so quotes and operators in it are searched as words.
+
+    Examples
+    --------
+    fts_phrase("нейронные сети")
+    '"нейронные сети"'
+    """
+    return '"' + query.strip().replace('"', '""') + '"'
+
+
+class TranscriptIndex:
+    """
+    SQLite FTS5 index of transcript segments, so already transcribed videos can be searched by phrase
+    and any time window can be summarized without transcribing the video again.
+
+    Segments of a new transcription replace indexed segments of the same video which lie inside its time range,
+    so transcript of a clip doesn't remove the rest of the video. Segments of videos not updated
+    for `ttl_seconds` are removed, like transcripts in the cache.
+
+    Only videos transcribed with the index are searchable: transcripts cached before have no timestamps,
+    they are indexed when the video is transcribed again.
+
+    Examples
+    --------
+    index = TranscriptIndex("runtimes/cache/segments.sqlite")
+    index.add_segments("XxCZC5dF8D8", segments, title="Video title")
+    for hit in index.search("нейронные сети"):
+        print(hit["video_id"], hit["start"], hit["text"])
+    text = index.window_text("XxCZC5dF8D8", 600, 900)
+    """
+
+    def __init__(self, path: str = "runtimes/cache/segments.sqlite", ttl_seconds: Optional[int] = None):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS videos (
+                video_id TEXT PRIMARY KEY,
+                title TEXT,
+                updated REAL NOT NULL
+            )""")
+        # segments were stored only in FTS5 table before, there video_id and time lookups scan all rows
+        old = self._db.execute("SELECT sql FROM sqlite_master WHERE name = 'segments'").fetchone()
+        migrate = old is not None and old["sql"].upper().startswith("CREATE VIRTUAL")
+        if migrate:
+            self._db.execute("ALTER TABLE segments RENAME TO segments_old")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                video_id TEXT NOT NULL,
+                start REAL NOT NULL,
+                end REAL NOT NULL,
+                text TEXT NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS segments_video_start ON segments (video_id, start)")
+        # full-text index over text of segments table, kept in sync by triggers
+        self._db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5 (
+                text,
+                content = 'segments',
+                content_rowid = 'id',
+                tokenize = 'unicode61 remove_diacritics 2'
+            )""")
+        self._db.execute("""
+            CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+            END""")
+        self._db.execute("""
+            CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END""")
+        if migrate:
+            self._db.execute("INSERT INTO segments (video_id, start, end, text) "
+                             "SELECT video_id, start, end, text FROM segments_old")
+            self._db.execute("DROP TABLE segments_old")
+        self._prune(time.time())
+        self._db.commit()
+
+    def _prune(self, now: float) -> None:
+        # segments live as long as cached transcripts, called with self._lock held or from __init__
+        if not self.ttl_seconds:
+            return
+        expired = [row["video_id"] for row in self._db.execute("SELECT video_id FROM videos WHERE updated < ?",
+                                                               (now - self.ttl_seconds,))]
+        for video_id in expired:
+            self._db.execute("DELETE FROM segments WHERE video_id = ?", (video_id,))
+            self._db.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+
+    def add_segments(self, video_id: str, segments: Iterable[dict], title: Optional[str] = None) -> int:
+        """
+        Index segments [{"start": float, "end": float, "text": str}, ...] of the video.
+        Returns number of indexed segments.
+        """
+        rows = [(segment["text"].strip(), video_id, float(segment["start"]), float(segment["end"]))
+                for segment in segments if segment["text"].strip()]
+        if not rows:
+            return 0
+        start, end = min(row[2] for row in rows), max(row[3] for row in rows)
+        with self._lock:
+            # segments which cross the borders of a clip keep text outside of it, so they stay
+            self._db.execute("DELETE FROM segments WHERE video_id = ? AND start >= ? AND end <= ?",
+                             (video_id, start, end))
+            self._db.executemany("INSERT INTO segments (text, video_id, start, end) VALUES (?, ?, ?, ?)", rows)
+            now = time.time()
+            self._db.execute("INSERT INTO videos (video_id, title, updated) VALUES (?, ?, ?) "
+                             "ON CONFLICT (video_id) DO UPDATE SET title = COALESCE(excluded.title, title), "
+                             "updated = excluded.updated", (video_id, title, now))
+            self._prune(now)
+            self._db.commit()
+        return len(rows)
+
+    def search(self, query: str, video_id: Optional[str] = None, limit: int = 20) -> List[dict]:
+        """
+        Segments containing the phrase, the best matches first.
+        """
+        if not query.strip():
+            return []
+        sql = ("SELECT segments.video_id, videos.title, segments.start, segments.end, segments.text, "
+               "snippet(segments_fts, 0, '[', ']', '...', 12) AS snippet "
+               "FROM segments_fts JOIN segments ON segments.id = segments_fts.rowid "
+               "LEFT JOIN videos ON videos.video_id = segments.video_id "
+               "WHERE segments_fts MATCH ?")
+        params = [fts_phrase(query)]
+        if video_id:
+            sql += " AND segments.video_id = ?"
+            params.append(video_id)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(sql, params)]
+
+    def window_segments(self, video_id: str, start: float, end: float) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute("SELECT start, end, text FROM segments WHERE video_id = ? AND start < ? "
+                                    "AND end > ? ORDER BY start", (video_id, end, start)).fetchall()
+        return [dict(row) for row in rows]
+
+    def window_text(self, video_id: str, start: float, end: float) -> str:
+        """
+        Transcript of the time window in seconds, empty if the window isn't indexed.
+        """
+        return " ".join(segment["text"] for segment in self.window_segments(video_id, start, end))
+
+    def title(self, video_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT title FROM videos WHERE video_id = ?", (video_id,)).fetchone()
+        return row["title"] if row else None
+
+
+def index_from_env() -> TranscriptIndex:
+    """
+    Create index in the cache folder set by CACHE_DIR env variable, with the same CACHE_TTL_DAYS as the cache.
+    """
+    return TranscriptIndex(os.path.join(os.getenv("CACHE_DIR", "runtimes/cache"), "segments.sqlite"),
+                           ttl_seconds=int(os.getenv("CACHE_TTL_DAYS", "30")) * 24 * 3600)
@@ -1,21 +1,53 @@
+import logging
+import multiprocessing
 import os
-import torch.cuda
-import whisper
-from typing import Tuple
-from openai import OpenAI
-from moviepy import AudioFileClip
-from pytube import YouTube
-from pytube.request import stream
+import re
+import subprocess
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+# torch, whisper, moviepy, pytube and openai are imported in functions which use them,
+# so entry points start fast and flows without transcription don't load them
+from src.backends import default_backend, get_backend
+from src.metrics import span
+from src.model_pool import get_device, model_pool
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+
+YOUTUBE_URL_RE = re.compile(r"^(https?://)?(www\.|m\.|music\.)?"
+                            r"(youtube\.com/(watch\?(.*&)?v=|shorts/|live/|embed/)|youtu\.be/)[a-zA-Z0-9_-]{11}")
 
 
 def is_youtube_url(url: str) -> bool:
-    if url.startswith("https://www.youtube.com/watch?v=") or \
-        url.startswith("https://www.youtube.com/shorts/") or \
-        url.startswith("www.youtube.com/watch?v=") or \
-        url.startswith("https://youtube.com/watch?v=") or \
-        url.startswith("https://youtu.be/"):
-        return True
-    return False
+    """
+    Check that text is a link to YouTube video, with or without scheme and www, including shorts,
+    live, mobile and youtu.be links.
+
+    Examples
+    --------
+    is_youtube_url("https://m.youtube.com/watch?feature=share&v=XxCZC5dF8D8")
+    True
+    """
+    return YOUTUBE_URL_RE.match(url.strip()) is not None
+
+
+def youtube_video_id(url: str) -> Optional[str]:
+    """
+    Extract video ID from YouTube link without requests to YouTube.
+
+    Examples
+    --------
+    youtube_video_id("https://youtu.be/XxCZC5dF8D8")
+    'XxCZC5dF8D8'
+    """
+    match = re.search(r"(?:[?&]v=|/shorts/|/live/|/embed/|youtu\.be/)([a-zA-Z0-9_-]{11})", url)
+    return match.group(1) if match else None
+
 
 def parse_time_to_hhmmss(time: int) -> str:
     hours = time // 3600
@@ -36,6 +68,13 @@ def parse_time_to_seconds(time: str) -> int:
     return int(time_parts[0]) * 60 + int(time_parts[1])
 
 
+def _youtube(youtube_url: str, proxy=None):
+    from pytube import YouTube
+    if proxy:
+        return YouTube(youtube_url, proxies={"http": proxy, "https": proxy})
+    return YouTube(youtube_url)
+
+
 def video_info(youtube_url: str, proxy=None) -> Tuple:
     """
     Retrieve information of a YouTube video.
@@ -44,21 +83,36 @@ def video_info(youtube_url: str, proxy=None) -> Tuple:
     --------
     videoId, videoTitle, videoLength = video_info("https://www.youtube.com/watch?v=XxCZC5dF8D8")
     """
-    if proxy:
-        yt = YouTube(youtube_url, proxies={"http": proxy, "https": proxy})
-    else:
-        yt = YouTube(youtube_url)
-    return yt.video_id, yt.title, yt.length
+    with span("video_info"):
+        yt = _youtube(youtube_url, proxy)
+        return yt.video_id, yt.title, yt.length
 
 
 def trim_video(path_to_file: str, path_to_trimmed: str, timing: Tuple[str, str]) -> None:
-    file = AudioFileClip(path_to_file)
-    start_time, end_time = timing
-    if end_time == "":
-        v = file.subclipped(start_time)
-    else:
-        v = file.subclipped(start_time, end_time)
-    v.write_audiofile(path_to_trimmed, codec='mp3')
+    from moviepy import AudioFileClip
+    with span("trim") as attrs:
+        file = AudioFileClip(path_to_file)
+        start_time, end_time = timing
+        if end_time == "":
+            v = file.subclipped(start_time)
+        else:
+            v = file.subclipped(start_time, end_time)
+        v.write_audiofile(path_to_trimmed, codec='mp3')
+        attrs["bytes"] = os.path.getsize(path_to_trimmed)
+
+
+def audio_stream_url(youtube_url: str, proxy=None) -> str:
+    """
+    Direct URL of the audio stream of a YouTube video. Pass it to load_audio or transcribe_stream
+    to decode only part of the audio without downloading the whole file.
+
+    Examples
+    --------
+    url = audio_stream_url("https://www.youtube.com/watch?v=XxCZC5dF8D8")
+    audio = load_audio(url, start=600, end=1200)
+    """
+    yt = _youtube(youtube_url, proxy)
+    return yt.streams.filter(only_audio=True, mime_type='audio/mp4').first().url
 
 
 def download_audio(youtube_url: str, download_path: str, proxy=None) -> None:
@@ -69,50 +123,405 @@ def download_audio(youtube_url: str, download_path: str, proxy=None) -> None:
     --------
     download_audio("https://www.youtube.com/watch?v=XxCZC5dF8D8", "audio.mp4")
     """
-    if proxy:
-        yt = YouTube(youtube_url, proxies={"http": proxy, "https": proxy})
-    else:
-        yt = YouTube(youtube_url)
+    yt = _youtube(youtube_url, proxy)
     path, filename = os.path.split(download_path)
-    yt.streams.filter(only_audio=True, mime_type='audio/mp4').first().download(path, filename)
+    # download into temporary file and rename it when it is complete, so the file at download_path
+    # is never partial and concurrent downloads don't write into the same file
+    tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        with span("download") as attrs:
+            yt.streams.filter(only_audio=True, mime_type='audio/mp4').first().download(path, tmp_filename)
+            attrs["bytes"] = os.path.getsize(os.path.join(path, tmp_filename))
+        os.replace(os.path.join(path, tmp_filename), download_path)
+    finally:
+        if os.path.exists(os.path.join(path, tmp_filename)):
+            os.remove(os.path.join(path, tmp_filename))
 
 
-def convert_mp4_to_mp3(input_path: str, output_path: str) -> None:
+def convert_mp4_to_mp3(input_path: str, output_path: str, remove_input: bool = True) -> None:
     """
-    Convert an audio file from mp4 format to mp3.
+    Convert an audio file from mp4 format to mp3. Transcription doesn't need it,
+    use it only to export audio.
 
     Examples
     --------
     convert_mp4_to_mp3("audio.mp4", "audio.mp3")
     """
-    with AudioFileClip(input_path) as audio:
-        audio.write_audiofile(output_path, codec='mp3')
+    from moviepy import AudioFileClip
+    with span("convert", bytes=os.path.getsize(input_path)):
+        with AudioFileClip(input_path) as audio:
+            audio.write_audiofile(output_path, codec='mp3')
+
+    if remove_input:
+        os.remove(input_path)
+
+
+# Whisper works with 16 kHz mono audio
+SAMPLE_RATE = 16000
+
+
+def compact_audio_name(file_name: str) -> Optional[str]:
+    """
+    File name of compact audio copy kept for reuse, format is set by AUDIO_CACHE_FORMAT env variable
+    ('opus' - default, 'pcm' or 'none'). Returns None if copy shouldn't be kept.
+
+    Examples
+    --------
+    compact_audio_name("XxCZC5dF8D8")
+    'XxCZC5dF8D8.opus'
+    """
+    audio_format = os.getenv("AUDIO_CACHE_FORMAT", "opus").lower()
+    if audio_format == "none":
+        return None
+    return f"{file_name}.{audio_format}"
+
+
+class CompactAudioWriter:
+    """
+    Writes compact audio copy (.opus or raw .pcm) from decoded 16 kHz buffers, chunk by chunk.
+    File appears under output_path only after close(), so partial copies are never reused.
+
+    Examples
+    --------
+    writer = CompactAudioWriter("runtimes/XxCZC5dF8D8.opus")
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.close()
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        self.tmp_path = f"{output_path}.part"
+        self._file = None
+        self._process = None
+        if output_path.endswith(".pcm"):
+            self._file = open(self.tmp_path, "wb")
+        else:
+            # encode from the decoded buffers, so the source isn't decoded twice
+            cmd = ["ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+                   "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-i", "-",
+                   "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", self.tmp_path]
+            self._process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def write(self, audio: np.ndarray) -> None:
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16).tobytes()
+        if self._file:
+            self._file.write(pcm)
+        else:
+            self._process.stdin.write(pcm)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+        else:
+            self._process.stdin.close()
+            if self._process.wait() != 0:
+                raise RuntimeError(f"Failed to encode {self.output_path}")
+        os.replace(self.tmp_path, self.output_path)
+
+    def abort(self) -> None:
+        if self._file:
+            self._file.close()
+        else:
+            self._process.kill()
+            self._process.wait()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def _http_input_options(file_path: str, proxy: Optional[str]) -> List[str]:
+    if not file_path.startswith(("http://", "https://")):
+        return []
+    options = ["-reconnect", "1", "-reconnect_streamed", "1"]
+    if proxy:
+        options += ["-http_proxy", proxy]
+    return options
+
+
+def audio_duration(file_path: str, proxy: Optional[str] = None) -> float:
+    """
+    Duration of audio file or audio stream URL in seconds.
+    """
+    if file_path.endswith(".pcm"):
+        return os.path.getsize(file_path) / 2 / SAMPLE_RATE
+    cmd = ["ffprobe", "-v", "error", *_http_input_options(file_path, proxy),
+           "-show_entries", "format=duration", "-of", "csv=p=0", file_path]
+    out = subprocess.run(cmd, capture_output=True, check=True, text=True).stdout
+    return float(out.strip())
+
+
+def load_audio(file_path: str, keep_compact_path: Optional[str] = None,
+               start: float = 0, end: Optional[float] = None, proxy: Optional[str] = None) -> np.ndarray:
+    """
+    Decode audio file (m4a, webm, mp3, opus...) once into 16 kHz mono float32 buffer.
+    Only [start, end] range in seconds is decoded, ffmpeg seeks to start without decoding the beginning.
+    file_path can be http(s) URL of audio stream, then ffmpeg downloads only byte ranges it needs.
+    If keep_compact_path is set, compact copy (.opus or raw .pcm) is saved from the same buffer.
+
+    Examples
+    --------
+    audio = load_audio("runtimes/XxCZC5dF8D8.mp4", keep_compact_path="runtimes/XxCZC5dF8D8.opus")
+    """
+    if file_path.endswith(".pcm"):
+        count = -1 if end is None else int((end - start) * SAMPLE_RATE)
+        pcm = np.fromfile(file_path, np.int16, count=count, offset=int(start * SAMPLE_RATE) * 2)
+        audio = pcm.astype(np.float32) / 32768.0
+    else:
+        cmd = ["ffmpeg", "-nostdin", "-threads", "0", "-loglevel", "error"]
+        cmd += _http_input_options(file_path, proxy)
+        if start:
+            cmd += ["-ss", str(start)]
+        if end is not None:
+            cmd += ["-t", str(end - start)]
+        cmd += ["-i", file_path, "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-"]
+        with span("decode") as attrs:
+            try:
+                out = subprocess.run(cmd, capture_output=True, check=True).stdout
+            except subprocess.CalledProcessError as e:
+                raise RuntimeError(f"Failed to load audio: {e.stderr.decode()}") from e
+            audio = np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+            attrs["audio_seconds"] = round(len(audio) / SAMPLE_RATE, 3)
+    if keep_compact_path:
+        writer = CompactAudioWriter(keep_compact_path)
+        writer.write(audio)
+        writer.close()
+    return audio
+
+
+def _quietest_point(audio: np.ndarray, search_from: int) -> int:
+    # energy in 20 ms frames, cut in the middle of the quietest one
+    frame = SAMPLE_RATE // 50
+    region = audio[search_from:]
+    frames = len(region) // frame
+    if frames == 0:
+        return len(audio)
+    energy = np.square(region[:frames * frame].reshape(frames, frame)).mean(axis=1)
+    return search_from + int(np.argmin(energy)) * frame + frame // 2
+
+
+def iter_audio_chunks(file_path: str, chunk_seconds: int = 120, start: float = 0, end: Optional[float] = None,
+                      search_seconds: int = 5, proxy: Optional[str] = None) -> Iterator[Tuple[float, np.ndarray]]:
+    """
+    Decode audio file chunk by chunk, cutting chunks at the quietest point near chunk_seconds,
+    so words aren't split. Only one chunk is in memory at a time.
+
+    Examples
+    --------
+    for offset, audio in iter_audio_chunks("runtimes/XxCZC5dF8D8.opus"):
+        print(offset, len(audio))
+    """
+    if end is None:
+        end = audio_duration(file_path, proxy)
+    position = start
+    # tail shorter than 0.1 s is left out, ffmpeg may return few samples less than duration
+    while end - position > 0.1:
+        window_end = min(position + chunk_seconds + search_seconds, end)
+        audio = load_audio(file_path, start=position, end=window_end, proxy=proxy)
+        if len(audio) == 0:
+            break
+        if window_end < end:
+            cut = _quietest_point(audio, (chunk_seconds - search_seconds) * SAMPLE_RATE)
+        else:
+            cut = len(audio)
+        yield position, audio[:cut]
+        position += cut / SAMPLE_RATE
+
+
+def _transcribe_buffer(audio: np.ndarray, model_name: str, device: str, backend: Optional[str] = None,
+                       initial_prompt: Optional[str] = None) -> dict:
+    # Model is loaded once per process and kept warm in the pool
+    engine = get_backend(backend)
+    with model_pool.use(model_name, device, engine.name) as model:
+        with span("transcribe", audio_seconds=round(len(audio) / SAMPLE_RATE, 3),
+                  backend=engine.name, model=model_name):
+            return engine.transcribe(model, audio, initial_prompt=initial_prompt)
+
+
+def transcribe_stream(file_path: str, model_name="medium", start: float = 0, end: Optional[float] = None,
+                      chunk_seconds: int = 120, keep_compact_path: Optional[str] = None,
+                      proxy: Optional[str] = None, backend: Optional[str] = None) -> Iterator[dict]:
+    """
+    Transcribe audio file chunk by chunk and yield timestamped segments as soon as chunk is done.
+    Memory usage doesn't depend on audio length. keep_compact_path makes compact copy of
+    the decoded audio along the way (use it only for the whole file).
+
+    Examples
+    --------
+    for segment in transcribe_stream("runtimes/XxCZC5dF8D8.opus", "turbo"):
+        print(segment["start"], segment["end"], segment["text"])
+    """
+    device = get_device()
+    logging.info(f"Transcribe using device {device}")
+    writer = CompactAudioWriter(keep_compact_path) if keep_compact_path else None
+    prompt = None
+    try:
+        for offset, audio in iter_audio_chunks(file_path, chunk_seconds, start, end, proxy=proxy):
+            if writer:
+                writer.write(audio)
+            # end of previous chunk gives the model context of the speech
+            result = _transcribe_buffer(audio, model_name, device, backend, initial_prompt=prompt)
+            for segment in result["segments"]:
+                yield {"start": offset + segment["start"], "end": offset + segment["end"], "text": segment["text"]}
+            prompt = result["text"][-200:] or None
+        if writer:
+            writer.close()
+            writer = None
+    finally:
+        if writer:
+            writer.abort()
+
+
+def _init_parallel_worker(model_name: str, threads: int, backend: Optional[str]) -> None:
+    # every worker process keeps its own warm model and uses only its share of cores
+    import torch
+    torch.set_num_threads(threads)
+    os.environ["FASTER_WHISPER_THREADS"] = str(threads)
+    model_pool.preload([model_name], "cpu", backend)
+
+
+def _transcribe_window(file_path: str, model_name: str, start: float, end: float,
+                       backend: Optional[str]) -> List[dict]:
+    audio = load_audio(file_path, start=start, end=end)
+    result = _transcribe_buffer(audio, model_name, "cpu", backend)
+    return [{"start": start + segment["start"], "end": start + segment["end"], "text": segment["text"]}
+            for segment in result["segments"]]
+
+
+def _normalize_text(text: str) -> str:
+    return "".join(ch for ch in text.lower() if ch.isalnum())
+
+
+def _words(segments: List[dict]) -> List[Tuple[int, str]]:
+    # (index of segment, word) for every word of the segments
+    return [(i, word) for i, segment in enumerate(segments) for word in segment["text"].split()]
+
+
+def _join_words(segments: List[dict], words: List[Tuple[int, str]]) -> List[dict]:
+    # segments rebuilt from the part of their words, segments without words left are dropped
+    texts = {}
+    for i, word in words:
+        texts.setdefault(i, []).append(word)
+    return [{**segments[i], "text": " " + " ".join(parts)} for i, parts in texts.items()]
+
+
+def _longest_common_run(a: List[str], b: List[str]) -> Tuple[int, int, int]:
+    # longest run of equal words in a and b: (start in a, start in b, length), empty words never match
+    best = (0, 0, 0)
+    previous = [0] * (len(b) + 1)
+    for i in range(len(a)):
+        current = [0] * (len(b) + 1)
+        for j in range(len(b)):
+            if a[i] and a[i] == b[j]:
+                current[j + 1] = previous[j] + 1
+                if current[j + 1] > best[2]:
+                    best = (i - previous[j], j - previous[j], current[j + 1])
+        previous = current
+    return best
+
+
+def _stitch_windows(windows: List[Tuple[float, float, List[dict]]]) -> List[dict]:
+    # Overlap of two windows is transcribed twice, usually with different segment boundaries.
+    # Words of the first window in the overlap are aligned with words of the second one by their longest
+    # common run: words before the run are taken from the first window, the run and the rest from the second.
+    segments = []
+    previous_end = None
+    for start, end, window_segments in windows:
+        if previous_end is None or start >= previous_end:
+            segments.extend(window_segments)
+            previous_end = end
+            continue
+        tail_from = next((i for i, segment in enumerate(segments) if segment["end"] > start), len(segments))
+        head_to = next((i for i, segment in enumerate(window_segments) if segment["start"] >= previous_end),
+                       len(window_segments))
+        tail, head = segments[tail_from:], window_segments[:head_to]
+        tail_words, head_words = _words(tail), _words(head)
+        a_start, b_start, length = _longest_common_run([_normalize_text(word) for _, word in tail_words],
+                                                       [_normalize_text(word) for _, word in head_words])
+        if length:
+            overlap = _join_words(tail, tail_words[:a_start]) + _join_words(head, head_words[b_start:])
+        else:
+            # nothing in common: the first window keeps segments which start before the middle of overlap,
+            # the second one gives segments which end after the last kept one
+            middle = (start + previous_end) / 2
+            kept = [segment for segment in tail if segment["start"] < middle]
+            cut = kept[-1]["end"] if kept else start
+            overlap = kept + [segment for segment in head if segment["end"] > cut]
+        segments = segments[:tail_from] + overlap + window_segments[head_to:]
+        previous_end = end
+    return segments
+
+
+_parallel_pools = {}
+
+
+def _parallel_pool(model_name: str, workers: int, threads_per_worker: int, backend: Optional[str]):
+    key = model_name, workers, threads_per_worker, backend
+    if key not in _parallel_pools:
+        _parallel_pools[key] = ProcessPoolExecutor(max_workers=workers,
+                                                   mp_context=multiprocessing.get_context("spawn"),
+                                                   initializer=_init_parallel_worker,
+                                                   initargs=(model_name, threads_per_worker, backend))
+    return _parallel_pools[key]
+
+
+def transcribe_parallel(file_path: str, model_name="medium", workers: Optional[int] = None,
+                        threads_per_worker: Optional[int] = None, window_seconds: int = 300,
+                        overlap_seconds: int = 10, start: float = 0, end: Optional[float] = None,
+                        backend: Optional[str] = None) -> List[dict]:
+    """
+    Transcribe long audio on CPU: split it into overlapping windows, transcribe windows in process pool
+    and stitch segments back. Worker processes stay alive between calls with warm models.
+    Defaults are taken from TRANSCRIBE_WORKERS and TRANSCRIBE_THREADS_PER_WORKER env variables.
 
-    os.remove(input_path)
+    Examples
+    --------
+    segments = transcribe_parallel("runtimes/XxCZC5dF8D8.opus", "small", workers=4, threads_per_worker=2)
+    text = "".join(segment["text"] for segment in segments)
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = workers or int(os.getenv("TRANSCRIBE_WORKERS", max(1, cpu_count // 4)))
+    threads_per_worker = threads_per_worker or int(os.getenv("TRANSCRIBE_THREADS_PER_WORKER",
+                                                             max(1, cpu_count // workers)))
+    if end is None:
+        end = audio_duration(file_path)
+    bounds = []
+    position = start
+    while position < end:
+        bounds.append((max(start, position - overlap_seconds), min(end, position + window_seconds)))
+        position += window_seconds
+    backend = backend or default_backend()
+    pool = _parallel_pool(model_name, workers, threads_per_worker, backend)
+    futures = [pool.submit(_transcribe_window, file_path, model_name, window_start, window_end, backend)
+               for window_start, window_end in bounds]
+    windows = [(window_start, window_end, future.result())
+               for (window_start, window_end), future in zip(bounds, futures)]
+    return _stitch_windows(windows)
 
 
-def transcribe(file_path: str, model_name="medium") -> str:
+def transcribe(audio: Union[str, np.ndarray], model_name="medium", keep_compact_path: Optional[str] = None,
+               backend: Optional[str] = None) -> str:
     """
-    Transcribe input audio file.
+    Transcribe input audio file or 16 kHz mono float32 buffer.
+    backend is name of transcription engine from src.backends, by default TRANSCRIBE_BACKEND env variable.
 
     Examples
     --------
-    text = transcribe(".../audio.mp3")
+    text = transcribe(".../audio.mp4")
     print(text)
     'This text explains...'
     """
-    if torch.cuda.is_available():
-        device = "cuda"
-    elif torch.backends.mps.is_available():
-        device = "mps"
-    else:
-        device = "cpu"
-    print(f"Transcribe using device {device}")
-    model = whisper.load_model(model_name, device=device)
-    result = model.transcribe(file_path)
+    if isinstance(audio, str):
+        audio = load_audio(audio, keep_compact_path)
+    device = get_device()
+    logging.info(f"Transcribe using device {device}")
+    result = _transcribe_buffer(audio, model_name, device, backend)
     return result['text']
 
 
+# Bump when summary_prompt changes, so cached summaries made with old prompt are not reused
+PROMPT_VERSION = 2
+
+
 def summary_prompt(input_text: str) -> str:
     """
     Build prompt using input text of the video.
@@ -127,6 +536,13 @@ def summary_prompt(input_text: str) -> str:
     return prompt
 
 
+@lru_cache(maxsize=8)
+def _openai_client(api_key: Optional[str]) -> "OpenAI":
+    # client keeps pool of HTTP connections, so it is created once per API key
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
 def summarize_openai_text(input_text: str, model: str = "gpt-3.5-turbo", api_key: str = None) -> str:
     """
     Summarize input text of the video.
@@ -138,17 +554,20 @@ def summarize_openai_text(input_text: str, model: str = "gpt-3.5-turbo", api_key
     'This video explains...'
     """
     # Send request to OpenAI
-    openai = OpenAI(api_key=api_key)
-    response = openai.chat.completions.create(
-        model=model,
-        messages=[
-            {
-                "role": "user",
-                "content": summary_prompt(input_text),
-            }
-        ],
-        temperature=0.6,  # Уровень случайности вывода модели
-
-    )
+    openai = _openai_client(api_key)
+    with span("summarize", backend="openai", model=model) as attrs:
+        response = openai.chat.completions.create(
+            model=model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": summary_prompt(input_text),
+                }
+            ],
+            temperature=0.6,  # Уровень случайности вывода модели
+
+        )
+        if response.usage:
+            attrs["tokens"] = response.usage.total_tokens
     # Return response
     return response.choices[0].message.content
@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from src.utils import _stitch_windows
+
+
+def text_of(segments):
+    return " ".join(" ".join(segment["text"].split()) for segment in segments)
+
+
+def test_stitch_windows_keeps_word_split_differently_in_overlap():
+    # overlap 290-310, the second window puts "c" into a segment which starts before the middle
+    first = [{"start": 280, "end": 300, "text": " a b"}, {"start": 300, "end": 310, "text": " c"}]
+    second = [{"start": 290, "end": 305, "text": " c"}, {"start": 305, "end": 320, "text": " d e"}]
+    segments = _stitch_windows([(0, 310, first), (290, 600, second)])
+    assert text_of(segments) == "a b c d e"
+
+
+def test_stitch_windows_drops_repeated_words_of_mismatched_segments():
+    first = [{"start": 270, "end": 285, "text": " w"}, {"start": 285, "end": 302, "text": " x y"}]
+    second = [{"start": 296, "end": 306, "text": " y z"}, {"start": 306, "end": 320, "text": " end"}]
+    segments = _stitch_windows([(0, 310, first), (290, 600, second)])
+    assert text_of(segments) == "w x y z end"
+    assert [segment["start"] for segment in segments] == sorted(segment["start"] for segment in segments)
+
+
+def test_stitch_windows_without_common_words():
+    first = [{"start": 280, "end": 298, "text": " one"}]
+    second = [{"start": 290, "end": 297, "text": " uno"}, {"start": 297, "end": 320, "text": " two"}]
+    segments = _stitch_windows([(0, 310, first), (290, 600, second)])
+    assert text_of(segments) == "one two"